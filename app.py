@@ -1,39 +1,139 @@
 #!/usr/bin/env python
 import argparse
-
-import time
+import asyncio
+import random
 
 from app.screen import Screen
-from app.keypad import Keypad
+from app.keypad import Keypad, REWIND_KEY
 from app.cpu import CPU
+from app.batch import make_runner, ENGINES
+from app.scheduler import Scheduler, DEFAULT_IPS
+from app.async_scheduler import AsyncScheduler
+from app.renderer import ThreadedRenderer
+from app.clock import WallClock, CycleClock
+from app.rewind import Rewind, DEFAULT_INTERVAL
+from app.replay import Recording, RecordingKeypad
+from app.profiler import Profiler
+from app.trace import Tracer
 from curses import wrapper
 import logging
 
+TRACE_FILE = 'trace.bin'
 
 parser = argparse.ArgumentParser(description='Runs a CHIP-8 ROM.')
 parser.add_argument('rom', help='The path to a valid CHIP-8 ROM')
-parser.add_argument('-d', '--debug', help='Log debug info to log.log', action='store_true')
+parser.add_argument('-d', '--debug', help='Log to log.log and trace every instruction to {}'.format(TRACE_FILE),
+                    action='store_true')
+parser.add_argument('--engine', help='How to execute the ROM (default: interpreter)',
+                    choices=ENGINES, default='interpreter')
+parser.add_argument('--ips', help='Instructions per second, 0 for unlimited (default: %(default)s)',
+                    type=int, default=DEFAULT_IPS)
+parser.add_argument('--clock', help='What drives the 60 Hz timers: real time, or the number of '
+                                    'instructions executed at the --ips rate (default: wall)',
+                    choices=('wall', 'cycles'), default='wall')
+parser.add_argument('--rewind-interval', help='Frames between rewind snapshots, 0 to disable. '
+                                              'Press {} to rewind (default: %(default)s)'.format(REWIND_KEY),
+                    type=int, default=DEFAULT_INTERVAL)
+parser.add_argument('--seed', help='Seed for CXNN random numbers', type=int)
+parser.add_argument('--record', help='Record input to this file for replaying with app.replay. '
+                                     'Implies --clock cycles and disables rewinding', metavar='FILE')
+parser.add_argument('--trace', help='Trace every instruction to FILE for comparing with app.trace. '
+                                    'Binary unless FILE ends in .jsonl. Interpreter engine only, so '
+                                    'traces compare revisions rather than engines', metavar='FILE')
+parser.add_argument('--asyncio', help='Run the CPU, rendering and input as separate asyncio tasks',
+                    action='store_true')
+parser.add_argument('--threaded-render', help='Present the screen from a separate thread',
+                    action='store_true')
+parser.add_argument('--no-idle-skip', help='Execute idle loops instead of fast-forwarding through them. '
+                                           'Skipped loops are not traced or profiled',
+                    action='store_true')
+parser.add_argument('--profile', help='Print per-operation and hot address statistics on exit',
+                    action='store_true')
 args = parser.parse_args()
+if args.profile and args.engine != 'interpreter':
+    parser.error('--profile only works with the interpreter engine')
+if args.debug and not args.trace:
+    args.trace = TRACE_FILE
+if args.trace and args.engine != 'interpreter':
+    parser.error('--trace and --debug only work with the interpreter engine')
+if args.record:
+    if not args.ips:
+        parser.error('--record needs a fixed --ips')
+    args.clock = 'cycles'
+    args.rewind_interval = 0
+    if args.seed is None:
+        args.seed = random.randrange(2 ** 32)
+
+
+profiler = None
 
 
 def main(stdscr):
+    global profiler
+
     if args.debug:
         logging.basicConfig(filename='log.log', level=logging.DEBUG, filemode='w')
 
     s = Screen(stdscr)
     k = Keypad(stdscr)
-    cpu = CPU(s, k)
+    if args.record:
+        k = RecordingKeypad(k, lambda: cpu.cycles)
+    if args.clock == 'cycles':
+        clock = CycleClock(args.ips or DEFAULT_IPS)
+    else:
+        clock = WallClock()
+    cpu = CPU(s, k, clock)
+    if args.seed is not None:
+        cpu.seed(args.seed)
 
     logging.info('Loading program %s', args.rom)
-    with open(args.rom, 'rb') as f:
-        cpu.load_program(f.read())
+    cpu.load_program_file(args.rom)
+
+    run = make_runner(cpu, args.engine)
+    present, poll = s.present, k.poll
+    renderer = None
+    if args.threaded_render:
+        renderer = ThreadedRenderer(s)
+        present, poll = renderer.swap, renderer.try_locked(k.poll)
+    if args.asyncio:
+        scheduler = AsyncScheduler(cpu, run, present, poll, ips=args.ips or None, skip_idle=not args.no_idle_skip)
+    else:
+        scheduler = Scheduler(cpu, run, present, ips=args.ips or None, skip_idle=not args.no_idle_skip)
+        scheduler.frame_hooks.append(poll)
+    if args.rewind_interval:
+        rewind = Rewind(cpu, args.rewind_interval)
+        k.hotkeys[REWIND_KEY] = rewind.rewind
+        scheduler.frame_hooks.append(rewind.frame)
+
+    if args.profile:
+        profiler = Profiler(cpu)
+        profiler.start()
+    tracer = Tracer(cpu, args.trace) if args.trace else None
+    if tracer:
+        tracer.start()
 
-    logging.info('Running CPU')
-    while True:
-        cpu()
-        time.sleep(0.01)
+    logging.info('Running CPU with the %s engine', args.engine)
+    if renderer:
+        renderer.start()
+    try:
+        if args.asyncio:
+            asyncio.run(scheduler.run_forever())
+        else:
+            scheduler.run_forever()
+    finally:
+        if renderer:
+            renderer.stop()
+        if tracer:
+            tracer.stop()
+        if profiler:
+            profiler.stop()
+        if args.record:
+            Recording.finish(cpu, k, args.rom, args.seed, args.ips).save(args.record)
 
 try:
     wrapper(main)
 except KeyboardInterrupt:
     print('Goodbye!')
+finally:
+    if profiler:
+        print(profiler.report())
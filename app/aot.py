@@ -0,0 +1,180 @@
+# Translates a whole ROM ahead of time and caches the result on disk.
+#
+# A static pass starting at 0x200 follows every jump, call and skip it can
+# decode, translating each reachable block with the BlockTranslator. The
+# blocks are compiled together as one Python module, which is marshalled to
+# the cache keyed by a hash of the ROM, so later launches just load it.
+#
+# Anything the pass could not see - code reached through BNNN or returns it
+# could not follow - is left to the interpreter, as are blocks invalidated
+# by writes to memory until their bytes match the ROM again, e.g. after a
+# rewind.
+
+import hashlib
+import importlib.util
+import logging
+import marshal
+import os
+import types
+
+from .jit import BlockTranslator, Block, MAX_BLOCK_LENGTH
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 3
+
+# Where control can go after each terminating operation, relative to its
+# address. Operations not listed carry on to the next instruction.
+_SKIPS = ('3XNN', '4XNN', '5XY0', '9XY0', 'EX9E', 'EXA1')
+_NO_SUCCESSORS = ('00EE', 'BNNN', '0NNN')
+
+
+def successors(definition, address, opcode):
+    if definition is None or definition.str in _NO_SUCCESSORS:
+        return []
+    elif definition.str == '1NNN':
+        return [opcode & 0x0fff]
+    elif definition.str == '2NNN':
+        return [opcode & 0x0fff, address + 2]
+    elif definition.str in _SKIPS:
+        return [address + 2, address + 4]
+    return [address + 2]
+
+
+def default_cache_directory():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'py-chip-8', 'aot')
+
+
+def rom_bytes(cpu) -> bytes:
+    # Memory doesn't remember how long the program was, but trailing zeros
+    # make no difference to the translation
+    return bytes(cpu.memory[cpu.memory.program_start:]).rstrip(b'\x00')
+
+
+def cache_key(rom: bytes, max_block_length=MAX_BLOCK_LENGTH) -> str:
+    # Bytecode is only good for the interpreter version that compiled it
+    h = hashlib.sha256(rom)
+    h.update(importlib.util.MAGIC_NUMBER)
+    h.update('{}:{}'.format(CACHE_VERSION, max_block_length).encode())
+    return h.hexdigest()
+
+
+class AheadOfTimeTranslator(BlockTranslator):
+
+    def __init__(self, cpu, cache_directory=None, max_block_length=MAX_BLOCK_LENGTH):
+        super().__init__(cpu, max_block_length)
+        self.cache_directory = cache_directory or default_cache_directory()
+        self.cache_hit = False
+        # start: (block, the bytes it was compiled from) for every block
+        # in the module, including any since invalidated
+        self.compiled = {}
+        self.load()
+
+    def discover(self):
+        # Returns (start, body, terminator) for every block reachable from
+        # the program start, in address order
+        memory = self.cpu.memory
+        start = memory.program_start
+        end = start + len(rom_bytes(self.cpu))
+        pending = [start]
+        found = {}
+        while pending:
+            address = pending.pop()
+            if address in found or not start <= address < end or address + 1 >= len(memory):
+                continue
+            body, terminator = self.decode_block(address)
+            found[address] = (address, body, terminator)
+            if terminator is None:
+                pending.append(address + len(body) * 2)
+            else:
+                terminator_address, opcode = terminator
+                pending += successors(self.cpu.operations.lookup(opcode), terminator_address, opcode)
+        return [found[address] for address in sorted(found)]
+
+    def compile_rom(self):
+        # Returns the module's code object and (start, length, terminator
+        # opcode or None) for each block it defines
+        sources = []
+        blocks = []
+        for start, body, terminator in self.discover():
+            source, length = self.generate(start, body, terminator)
+            sources.append(source)
+            blocks.append((start, length, None if terminator is None else terminator[1]))
+        source = '\n\n'.join(sources)
+        return source, compile(source, '<chip8 rom>', 'exec'), tuple(blocks)
+
+    def install(self, code, blocks):
+        namespace = {}
+        exec(code, namespace)
+        for start, length, terminator in blocks:
+            fn = namespace['block_{:03x}'.format(start)]
+            if terminator is not None:
+                # Each block calls its own terminator through its globals
+                inst = self.cpu.decode_instruction(terminator)
+                fn = types.FunctionType(fn.__code__, {
+                    'terminator': self.cpu.operations[inst.data],
+                    'terminator_instruction': inst,
+                }, fn.__name__)
+            block = Block(start, length, fn, None)
+            self.compiled[start] = (block, bytes(self.cpu.memory.view(block.start, block.stop)))
+            self.reinstall(block)
+
+    def reinstall(self, block):
+        self.blocks[block.start] = block
+        for address in range(block.start, block.stop):
+            self.owners[address].add(block.start)
+
+    def clear(self):
+        super().clear()
+        self.compiled.clear()
+
+    def load(self):
+        key = cache_key(rom_bytes(self.cpu), self.max_block_length)
+        path = os.path.join(self.cache_directory, key + '.marshal')
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    code, blocks = marshal.load(f)
+                self.install(code, blocks)
+                self.cache_hit = True
+                return
+            except (OSError, EOFError, ValueError, TypeError, KeyError) as e:
+                logger.warning('Ignoring unreadable translation cache %s: %s', path, e)
+                self.clear()
+
+        source, code, blocks = self.compile_rom()
+        self.install(code, blocks)
+        try:
+            os.makedirs(self.cache_directory, exist_ok=True)
+            # Only for reading; the marshalled code is what gets loaded
+            with open(os.path.join(self.cache_directory, key + '.py'), 'w') as f:
+                f.write(source)
+            temporary = '{}.{}.tmp'.format(path, os.getpid())
+            with open(temporary, 'wb') as f:
+                marshal.dump((code, blocks), f)
+            os.replace(temporary, path)
+        except OSError as e:
+            logger.warning('Could not write translation cache %s: %s', path, e)
+
+    def run(self, cycles):
+        # Like BlockTranslator.run, but anything without a block is
+        # interpreted rather than translated
+        cpu = self.cpu
+        blocks = self.blocks
+        compiled = self.compiled
+        executed = 0
+        while executed < cycles:
+            block = blocks.get(cpu.pc)
+            if block is None and cpu.pc in compiled:
+                block, code = compiled[cpu.pc]
+                if cpu.memory.view(block.start, block.stop) == code:
+                    self.reinstall(block)
+                else:
+                    block = None
+            if block is not None and block.length <= cycles - executed:
+                executed += block.fn(cpu)
+            else:
+                cpu.step()
+                executed += 1
+        return executed
@@ -0,0 +1,62 @@
+# Runs the emulator as cooperative asyncio tasks, so it can share an event
+# loop with other work.
+#
+#     scheduler = AsyncScheduler(cpu, present=screen.present, poll=keypad.poll)
+#     await scheduler.run_forever()
+#
+# The CPU task runs a frame's worth of instructions, ticks the timers and
+# runs the frame hooks; the render task presents the framebuffer and the
+# input task polls the keypad, each at the frame rate. They only share the
+# framebuffer and the keypad bitmap, and each yields to the event loop
+# between frames.
+
+import asyncio
+
+from .scheduler import Scheduler
+
+
+class AsyncScheduler(Scheduler):
+    # sleep is a coroutine function, asyncio.sleep by default
+
+    def __init__(self, cpu, run=None, present=None, poll=None, sleep=asyncio.sleep, **kwargs):
+        super(AsyncScheduler, self).__init__(cpu, run, present, sleep=sleep, **kwargs)
+        self.poll = poll
+        self.running = False
+
+    async def run_cpu(self):
+        while self.running:
+            for _ in self._run_cpu_frame():
+                await self.sleep(0)
+            self.frames += 1
+            await self.sleep(self._time_left())
+
+    async def _every_frame(self, callback):
+        next_frame = self.clock()
+        while self.running:
+            callback()
+            next_frame += self.frame_duration
+            remaining = next_frame - self.clock()
+            if remaining < 0:
+                # Fell behind; don't try to catch up
+                next_frame = self.clock()
+            await self.sleep(max(remaining, 0))
+
+    async def run_forever(self):
+        # Returns once stop() is called, or raises whatever stopped a task
+        self.running = True
+        tasks = [asyncio.ensure_future(self.run_cpu())]
+        for callback in (self.present, self.poll):
+            if callback is not None:
+                tasks.append(asyncio.ensure_future(self._every_frame(callback)))
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+        finally:
+            self.running = False
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop(self):
+        self.running = False
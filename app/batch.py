@@ -0,0 +1,122 @@
+# Runs a directory of ROMs headlessly, one per process, and reports on each.
+#
+#     python -m app.batch test-roms --frames 600 --output report.json
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .aot import AheadOfTimeTranslator
+from .clock import CycleClock, DEFAULT_IPS
+from .cpu import CPU
+from .jit import BlockTranslator
+from .keypad import ScriptedKeypad
+from .screen import VirtualScreen, FRAME_RATE
+
+ENGINES = ('interpreter', 'jit', 'aot')
+
+
+def make_runner(cpu, engine):
+    if engine == 'jit':
+        return BlockTranslator(cpu).run
+    elif engine == 'aot':
+        return AheadOfTimeTranslator(cpu).run
+    elif engine == 'interpreter':
+        return cpu.run
+    raise ValueError('Unknown engine: {}'.format(engine))
+
+
+def run_rom(path, cycles=None, frames=None, ips=DEFAULT_IPS, engine='interpreter', key_events=(), seed=None):
+    if cycles is None:
+        if frames is None:
+            raise ValueError('Either cycles or frames must be given')
+        cycles = frames * ips // FRAME_RATE
+
+    keypad = ScriptedKeypad(key_events)
+    cpu = CPU(VirtualScreen(), keypad, CycleClock(ips))
+    if seed is not None:
+        cpu.seed(seed)
+    cpu.load_program_file(path)
+    run = make_runner(cpu, engine)
+
+    exit_reason = 'completed'
+    errors = []
+    started = time.perf_counter()
+    try:
+        while cpu.cycles < cycles:
+            keypad.update(cpu.cycles)
+            next_event = keypad.next_event_cycle
+            stop = cycles if next_event is None else min(cycles, max(next_event, cpu.cycles + 1))
+            run(stop - cpu.cycles)
+    except NotImplementedError as e:
+        exit_reason = 'unsupported_opcode'
+        errors.append(str(e))
+    except Exception as e:
+        exit_reason = 'error'
+        errors.append('{}: {}'.format(type(e).__name__, e))
+    elapsed = time.perf_counter() - started
+
+    return {
+        'rom': path,
+        'engine': engine,
+        'cycles': cpu.cycles,
+        'frames': cpu.clock.ticks,
+        'seconds': elapsed,
+        'ips': cpu.cycles / elapsed if elapsed > 0 else None,
+        'pc': cpu.pc,
+        'framebuffer_sha256': hashlib.sha256(cpu.screen.to_bytes()).hexdigest(),
+        'exit_reason': exit_reason,
+        'errors': errors,
+    }
+
+
+def _run_rom(kwargs):
+    return run_rom(**kwargs)
+
+
+def run_directory(directory, pattern='*.ch8', workers=None, **options):
+    paths = sorted(glob.glob(os.path.join(directory, pattern)))
+    jobs = [dict(options, path=path) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_run_rom, jobs))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Runs a directory of CHIP-8 ROMs headlessly.')
+    parser.add_argument('directory', help='Directory containing the ROMs')
+    parser.add_argument('--pattern', default='*.ch8', help='Glob matching the ROMs (default: %(default)s)')
+    limit = parser.add_mutually_exclusive_group(required=True)
+    limit.add_argument('--cycles', type=int, help='Instructions to run per ROM')
+    limit.add_argument('--frames', type=int, help='60 Hz frames to run per ROM')
+    parser.add_argument('--ips', type=int, default=DEFAULT_IPS,
+                        help='Instructions per second, for timers and --frames (default: %(default)s)')
+    parser.add_argument('--engine', choices=ENGINES, default='interpreter')
+    parser.add_argument('--keys', help='JSON file of [cycle, key, pressed] events fed to every ROM')
+    parser.add_argument('--workers', type=int, help='Processes to use (default: one per core)')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args(argv)
+
+    key_events = ()
+    if args.keys:
+        with open(args.keys) as f:
+            key_events = [tuple(event) for event in json.load(f)]
+
+    reports = run_directory(args.directory, args.pattern, args.workers, cycles=args.cycles, frames=args.frames,
+                            ips=args.ips, engine=args.engine, key_events=key_events)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(reports, f, indent=2)
+    else:
+        json.dump(reports, sys.stdout, indent=2)
+        print()
+    return 0 if all(r['exit_reason'] == 'completed' for r in reports) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
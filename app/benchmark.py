@@ -0,0 +1,249 @@
+# Measures how fast the emulator is, and whether that got worse.
+#
+#     python -m app.benchmark --output bench.json
+#     python -m app.benchmark --baseline bench.json --threshold 0.1
+#
+# Every result records whether higher or lower is better, so a comparison
+# can flag regressions without knowing what each benchmark measures.
+
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+
+from .batch import run_rom, make_runner, ENGINES
+from .clock import CycleClock
+from .cpu import CPU, Memory
+from .keypad import VirtualKeypad
+from .screen import VirtualScreen
+
+try:
+    from .env import Chip8Env
+except ImportError:
+    # numpy isn't installed
+    Chip8Env = None
+
+ROM_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test-roms')
+DEFAULT_THRESHOLD = 0.1
+
+# Values substituted for the placeholders in OperationDefinition.str
+OPERAND_VALUES = {'X': '1', 'Y': '2', 'N': '5'}
+OPERAND_OVERRIDES = {'NNN': '300', 'XNN': '110'}
+
+SYNTHETIC_PROGRAMS = {
+    # Register arithmetic in a tight loop
+    'alu': [0x60, 0x01, 0x71, 0x01, 0x82, 0x14, 0x83, 0x25, 0x84, 0x06, 0xA3, 0x00, 0xF1, 0x1E, 0x12, 0x00],
+    # Draws and erases a font digit forever
+    'draw': [0x60, 0x08, 0xF0, 0x29, 0x61, 0x10, 0xD1, 0x15, 0xD1, 0x15, 0x70, 0x01, 0x12, 0x02],
+    # Calls a subroutine that does BCD and a register dump
+    'call': [0x22, 0x04, 0x12, 0x00, 0xA3, 0x00, 0xF0, 0x33, 0xF2, 0x55, 0x70, 0x01, 0x00, 0xEE],
+}
+
+
+def _result(value, unit, higher_is_better):
+    return {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+
+
+def _best_of(stmt, number, repeat=3):
+    return min(timeit.repeat(stmt, number=number, repeat=repeat)) / number
+
+
+def representative_opcode(format_str):
+    for placeholder, value in OPERAND_OVERRIDES.items():
+        if format_str.endswith(placeholder):
+            format_str = format_str[:-len(placeholder)] + value
+    return int(''.join(OPERAND_VALUES.get(c, c) for c in format_str), 16)
+
+
+def make_cpu(program=()):
+    cpu = CPU(VirtualScreen(), VirtualKeypad(), CycleClock())
+    cpu.load_program(program)
+    return cpu
+
+
+def bench_operations(number):
+    results = {}
+    cpu = make_cpu()
+    cpu.keypad.press(int(OPERAND_VALUES['X'], 16))
+
+    def reset():
+        cpu.pc = 0x200
+        cpu.sp = 1
+        cpu.index_register = 0x300
+    results['op.reset_overhead'] = _result(_best_of(reset, number) * 1e9, 'ns', False)
+
+    for definition in cpu.supported_operations:
+        if definition.cb == cpu.unsupported_operation:
+            continue
+        inst = cpu.decode_instruction(representative_opcode(definition.str))
+        handler = cpu.operations[inst.data]
+
+        def execute():
+            reset()
+            handler(inst)
+        results['op.' + definition.str] = _result(_best_of(execute, number) * 1e9, 'ns', False)
+    return results
+
+
+def bench_screen(number):
+    screen = VirtualScreen()
+    sprite = memoryview(bytes(range(0x11, 0x11 * 16, 0x11)))
+    positions = [(x * 7 % 64, y * 5 % 32) for x in range(8) for y in range(8)]
+
+    def draw():
+        for x, y in positions:
+            screen.write_sprite(x, y, sprite)
+    per_sprite = _best_of(draw, max(1, number // len(positions))) / len(positions)
+    return {'screen.write_sprite': _result(per_sprite * 1e9, 'ns', False)}
+
+
+def bench_memory(number):
+    memory = Memory()
+    rom = bytes(range(256)) * 14
+    return {'memory.load_data': _result(_best_of(lambda: memory.load_data(rom), number) * 1e9, 'ns', False)}
+
+
+def _ips(program, engine, cycles):
+    cpu = make_cpu(program)
+    run = make_runner(cpu, engine)
+    started = time.perf_counter()
+    run(cycles)
+    return cycles / (time.perf_counter() - started)
+
+
+def bench_throughput(cycles):
+    results = {}
+    for engine in ENGINES:
+        for name, program in sorted(SYNTHETIC_PROGRAMS.items()):
+            results['ips.{}.{}'.format(name, engine)] = _result(_ips(program, engine, cycles), 'ips', True)
+        for path in sorted(glob.glob(os.path.join(ROM_DIRECTORY, '*.ch8'))):
+            report = run_rom(path, cycles=cycles, engine=engine, key_events=[(cycles // 2, 0x5, True)])
+            name = os.path.splitext(os.path.basename(path))[0]
+            results['ips.rom.{}.{}'.format(name, engine)] = _result(report['ips'], 'ips', True)
+    return results
+
+
+def bench_env(steps):
+    if Chip8Env is None:
+        return {}
+    results = {}
+    for path in sorted(glob.glob(os.path.join(ROM_DIRECTORY, '*.ch8'))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        for frame_skip in (1, 4):
+            env = Chip8Env(path)
+            env.reset(seed=0)
+            step = env.step
+            prefix = 'env.{}.skip{}.'.format(name, frame_skip)
+            results[prefix + 'step'] = _result(
+                _best_of(lambda: step(0x5, frame_skip), steps) * 1e9, 'ns', False)
+
+            # Memory allocated on top of the steady state while stepping,
+            # and blocks still allocated afterwards, per step
+            tracemalloc.start()
+            try:
+                before, _ = tracemalloc.get_traced_memory()
+                blocks = sys.getallocatedblocks()
+                for _ in range(steps):
+                    step(0x5, frame_skip)
+                retained = sys.getallocatedblocks() - blocks
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            results[prefix + 'peak_bytes'] = _result(peak - before, 'B', False)
+            results[prefix + 'retained_blocks'] = _result(max(0, retained) / steps, 'blocks', False)
+
+        # Short episodes, where the cost of reset() matters
+        for engine in ENGINES:
+            env = Chip8Env(path, engine=engine)
+
+            def episode():
+                env.reset(seed=0)
+                for _ in range(5):
+                    env.step(0x5)
+            results['env.{}.{}.episode'.format(name, engine)] = _result(_best_of(episode, steps) * 1e6, 'us', False)
+    return results
+
+
+def bench_startup(repeat):
+    code = 'from app.cpu import CPU; CPU(None, None)'
+    root = os.path.dirname(ROM_DIRECTORY)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=root, check=True)
+        timings.append(time.perf_counter() - started)
+    return {'startup': _result(min(timings), 's', False)}
+
+
+def run_suite(quick=False):
+    number = 200 if quick else 20000
+    cycles = 2000 if quick else 200000
+    results = {}
+    results.update(bench_operations(number))
+    results.update(bench_screen(number))
+    results.update(bench_memory(max(1, number // 10)))
+    results.update(bench_throughput(cycles))
+    results.update(bench_env(max(1, number // 100)))
+    results.update(bench_startup(1 if quick else 5))
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    # Returns (name, baseline value, current value, relative change, regressed)
+    # for every benchmark in both runs. A positive change is an improvement.
+    rows = []
+    for name, result in sorted(current['results'].items()):
+        previous = baseline['results'].get(name)
+        if previous is None or not previous['value']:
+            continue
+        change = (result['value'] - previous['value']) / previous['value']
+        if not result['higher_is_better']:
+            change = -change
+        rows.append((name, previous['value'], result['value'], change, change < -threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks the emulator.')
+    parser.add_argument('--output', help='Write the results here as JSON')
+    parser.add_argument('--baseline', help='Compare against results saved by an earlier --output')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Relative slowdown that counts as a regression (default: %(default)s)')
+    parser.add_argument('--quick', action='store_true', help='Fewer iterations, for a smoke test')
+    args = parser.parse_args(argv)
+
+    current = run_suite(args.quick)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+
+    if not args.baseline:
+        for name, result in sorted(current['results'].items()):
+            print('{:40} {:>14.1f} {}'.format(name, result['value'], result['unit']))
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = 0
+    for name, before, after, change, regressed in compare(current, baseline, args.threshold):
+        regressions += regressed
+        print('{:40} {:>14.1f} {:>14.1f} {:>+8.1%}{}'.format(name, before, after, change, '  REGRESSED' if regressed else ''))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
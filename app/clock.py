@@ -0,0 +1,39 @@
+# Timers count down in 60 Hz ticks of a clock owned by the CPU.
+#
+# WallClock ticks whenever the scheduler finishes a frame, so it follows real
+# time. CycleClock derives its ticks from the number of instructions the CPU
+# has executed, which makes timer behaviour fully reproducible.
+
+from .screen import FRAME_RATE
+
+DEFAULT_IPS = 700
+
+
+class WallClock:
+
+    def __init__(self):
+        self.ticks = 0
+
+    def attach(self, cpu):
+        pass
+
+    def tick(self):
+        self.ticks += 1
+
+
+class CycleClock:
+
+    def __init__(self, ips=DEFAULT_IPS, frame_rate=FRAME_RATE):
+        self.ips = ips
+        self.frame_rate = frame_rate
+        self.cpu = None
+
+    def attach(self, cpu):
+        self.cpu = cpu
+
+    @property
+    def ticks(self):
+        return self.cpu.cycles * self.frame_rate // self.ips
+
+    def tick(self):
+        pass
@@ -2,13 +2,25 @@
 # http://mattmik.com/files/chip8/mastering/chip8.html
 # ...and whatever other docs I could find
 
-import random, datetime
+import random
+import mmap
+import os
+from array import array
+from functools import lru_cache
+from itertools import combinations
 from .screen import FONT, VirtualScreen
 from .keypad import Keypad
+from .clock import WallClock
 import math
-import logging
+import struct
 
-logger = logging.getLogger(__name__)
+SNAPSHOT_MAGIC = b'C8SS'
+SNAPSHOT_VERSION = 1
+# magic, version, pc, I, sp, cycles, delay timer, sound timer, held keys,
+# V0-VF, call stack, memory, framebuffer
+SNAPSHOT_FORMAT = struct.Struct('<4sHHHBQBBH16s16H4096s256s')
+# Granularity Memory.update() first compares at
+UPDATE_CHUNK_SIZE = 64
 
 
 class Register(object):
@@ -57,26 +69,49 @@ class IRegister(Register):
         self._value = 0xfff & self._normalize_other(x)
 
 
-class TimerRegister(Register):
+class RegisterView(Register):
+    # A Register backed by one slot of the CPU's register file
 
-    target_time = - float('inf')
+    def __init__(self, registers: bytearray, index: int):
+        self._registers = registers
+        self._index = index
 
-    def __init__(self):
-        self.logger = logger.getChild(self.__class__.__name__)
+    @property
+    def value(self):
+        return self._registers[self._index]
+
+    @value.setter
+    def value(self, x):
+        self._registers[self._index] = 0xff & self._normalize_other(x)
+
+
+class IRegisterView(IRegister):
+
+    def __init__(self, cpu):
+        self._cpu = cpu
+
+    @property
+    def value(self):
+        return self._cpu.index_register
+
+    @value.setter
+    def value(self, x):
+        self._cpu.index_register = 0xfff & self._normalize_other(x)
+
+
+class TimerRegister(Register):
+    # Counts down once per tick of the clock, stopping at 0
+
+    def __init__(self, clock=None):
+        self.clock = clock or WallClock()
+        self.target_tick = 0
 
     def get_value(self):
-        now = datetime.datetime.now()
-        if now > self.target_time:
-            return_value = 0
-        else:
-            return_value = round((self.target_time - now).total_seconds())
-        self.logger.debug('Returning value %s', return_value)
-        return return_value
+        remaining = self.target_tick - self.clock.ticks
+        return remaining if remaining > 0 else 0
 
     def set_value(self, x):
-        x = self._normalize_other(x)
-        self.target_time = datetime.datetime.now() + datetime.timedelta(seconds=x)
-        self.logger.debug('Target time set to %s', self.target_time)
+        self.target_tick = self.clock.ticks + (0xff & self._normalize_other(x))
 
     value = property(get_value, set_value)
 
@@ -118,53 +153,178 @@ class OperationDefinition:
     def responds_to(self, x):
         return x & self.mask == self.match_number
 
+    def is_more_specific_than(self, other):
+        return self.mask != other.mask and self.mask & other.mask == other.mask
+
+    def overlaps(self, other):
+        return (self.match_number ^ other.match_number) & self.mask & other.mask == 0
+
+    def matching_opcodes(self):
+        free_bits = ~self.mask & 0xffff
+        bits = free_bits
+        while True:
+            yield self.match_number | bits
+            if bits == 0:
+                return
+            bits = (bits - 1) & free_bits
+
     def __call__(self, inst: Instruction):
         if self.responds_to(inst.data):
-            logger.debug('Executing instruction for %s, with data %#x - %s', self.str, inst.data, self.description)
             self.cb(inst)
             return True
         else:
             return False
 
 
-class Memory(list):
+@lru_cache(maxsize=None)
+def _build_opcode_index(formats: tuple) -> bytes:
+    # Maps every 16 bit word to the position of the definition handling it,
+    # or to len(definitions) when nothing does. More specific masks win, so
+    # 00E0 and 00EE take precedence over 0NNN.
+    definitions = [OperationDefinition(f, None) for f in formats]
+    for a, b in combinations(definitions, 2):
+        if a.overlaps(b) and not (a.is_more_specific_than(b) or b.is_more_specific_than(a)):
+            raise ValueError('Ambiguous operation definitions: {} and {}'.format(a.str, b.str))
+
+    unmatched = len(definitions)
+    index = bytearray([unmatched]) * 0x10000
+    by_specificity = sorted(range(len(definitions)), key=lambda i: -bin(definitions[i].mask).count('1'))
+    for i in by_specificity:
+        for opcode in definitions[i].matching_opcodes():
+            if index[opcode] == unmatched:
+                index[opcode] = i
+    return bytes(index)
+
+
+class OperationTable:
+
+    def __init__(self, definitions, fallback):
+        self.definitions = tuple(definitions)
+        if len(self.definitions) >= 0xff:
+            raise ValueError('Too many operation definitions')
+        self.index = _build_opcode_index(tuple(d.str for d in self.definitions))
+        self.handlers = [d.cb for d in self.definitions] + [fallback]
+
+    def lookup(self, opcode: int):
+        i = self.index[opcode]
+        return self.definitions[i] if i < len(self.definitions) else None
+
+    def __getitem__(self, opcode: int):
+        return self.handlers[self.index[opcode]]
+
+
+class Memory(bytearray):
+
+    size = 4096
+    program_start = 0x200
 
     def __init__(self):
-        l = FONT[:]
-        while len(l) != 0x200:
-            l.append(0x12)
-            l.append(0x00)
-        while len(l) != 4096:
-            l.append(0x00)
-        super(Memory, self).__init__(l)
+        super(Memory, self).__init__(self.size)
+        self[:len(FONT)] = bytes(FONT)
+        self[len(FONT):self.program_start] = b'\x12\x00' * ((self.program_start - len(FONT)) // 2)
+        # Holding an export also pins the size, so views can never dangle
+        self._view = memoryview(self)
+        # Called with (start, stop) after every write(), so anything derived
+        # from memory contents (e.g. decoded instructions) can be dropped
+        self.observers = []
 
     @staticmethod
     def sprite_for_int(i: int) -> int:
         return i * 5
 
+    def view(self, start: int, stop: int) -> memoryview:
+        return self._view[start:stop]
+
+    def write(self, address: int, data):
+        stop = address + len(data)
+        if address < 0 or stop > len(self):
+            raise IndexError('Write of {} bytes at {:#x} is out of bounds'.format(len(data), address))
+        self[address:stop] = data
+        for observer in self.observers:
+            observer(address, stop)
+
+    def update(self, data):
+        # Makes memory equal to data, writing only the ranges that differ so
+        # observers keep anything derived from the rest
+        if len(data) != len(self):
+            raise ValueError('Expected {} bytes, got {}'.format(len(self), len(data)))
+        if self == data:
+            return
+        data = memoryview(data)
+        start = None
+        for offset in range(0, len(self) + UPDATE_CHUNK_SIZE, UPDATE_CHUNK_SIZE):
+            changed = self._view[offset:offset + UPDATE_CHUNK_SIZE] != data[offset:offset + UPDATE_CHUNK_SIZE]
+            if changed and start is None:
+                start = offset
+            elif not changed and start is not None:
+                stop = min(offset, len(self))
+                while self[start] == data[start]:
+                    start += 1
+                while self[stop - 1] == data[stop - 1]:
+                    stop -= 1
+                self.write(start, data[start:stop])
+                start = None
+
     def load_data(self, data):
-        for i, x in enumerate(data):
-            self[0x200 + i] = x
+        self.write(self.program_start, data)
+
+    def load_file(self, path):
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                self.load_data(data)
+
+
+class DecodedInstructionCache:
+
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.entries = [None] * len(cpu.memory)
+        cpu.memory.observers.append(self.invalidate)
+
+    def decode(self, address: int):
+        inst = self.cpu.decode_instruction(self.cpu.fetch_instruction(address))
+        entry = self.entries[address] = (self.cpu.operations[inst.data], inst)
+        return entry
+
+    def invalidate(self, start: int, stop: int):
+        # An instruction starting one byte before the write overlaps it too
+        start = max(start - 1, 0)
+        self.entries[start:stop] = [None] * (stop - start)
+
+    def clear(self):
+        self.entries = [None] * len(self.entries)
 
 
 class CPU(object):
     #program starts at 0x200
     #big endian - MSB first!
 
-    def __init__(self, screen: VirtualScreen, keypad: Keypad):
-        self.v = []
+    stack_size = 16
+
+    def __init__(self, screen: VirtualScreen, keypad: Keypad, clock=None):
+        # The hot path works on these directly...
+        self.registers = bytearray(16)
+        self.index_register = 0
         self.pc = 0x200
+        self.sp = 0
+        self.call_stack = array('H', [0] * self.stack_size)
+        # ...while v, vX and i are Register shaped views onto them
+        self.v = [RegisterView(self.registers, x) for x in range(16)]
+        self.i = IRegisterView(self)
+        self.cycles = 0
         self.memory = Memory()
-        self.i = IRegister()
-        self.stack = []
-        self.delay_timer = TimerRegister()
-        self.sound_timer = TimerRegister()
+        self.clock = clock or WallClock()
+        self.clock.attach(self)
+        self.delay_timer = TimerRegister(self.clock)
+        self.sound_timer = TimerRegister(self.clock)
         self.screen = screen
         self.keypad = keypad
+        # The random module by default, or a seeded Random after seed()
+        self.random = random
 
-        for x in range(0, 16):
-            r = Register()
-            self.v.append(r)
+        for x, r in enumerate(self.v):
             self.__dict__['v' + format(x, 'x')] = r
 
         #                        ;-)    Woohoo Python!
@@ -218,10 +378,41 @@ class CPU(object):
 
             OperationDefinition('0NNN', self.unsupported_operation,         'Execute native code - UNSUPPORTED'),
         )
+        self.operations = OperationTable(self.supported_operations, self.unsupported_operation)
+        self.decoded_instructions = DecodedInstructionCache(self)
+
+    def seed(self, seed):
+        self.random = random.Random(seed)
 
     def load_program(self, program):
         self.memory.load_data(program)
 
+    def load_program_file(self, path):
+        self.memory.load_file(path)
+
+    def snapshot(self) -> bytes:
+        return SNAPSHOT_FORMAT.pack(
+            SNAPSHOT_MAGIC, SNAPSHOT_VERSION, self.pc, self.index_register, self.sp, self.cycles,
+            self.delay_timer.value, self.sound_timer.value, getattr(self.keypad, 'held', 0),
+            bytes(self.registers), *self.call_stack, bytes(self.memory), self.screen.to_bytes())
+
+    def restore(self, snapshot: bytes):
+        if len(snapshot) != SNAPSHOT_FORMAT.size or snapshot[:4] != SNAPSHOT_MAGIC:
+            raise ValueError('Not a CHIP-8 snapshot')
+        fields = SNAPSHOT_FORMAT.unpack(snapshot)
+        if fields[1] != SNAPSHOT_VERSION:
+            raise ValueError('Unsupported snapshot version: {}'.format(fields[1]))
+        if fields[4] > self.stack_size:
+            raise ValueError('Snapshot stack pointer {} is out of range'.format(fields[4]))
+
+        (self.pc, self.index_register, self.sp, self.cycles,
+         self.delay_timer.value, self.sound_timer.value, held_keys, self.registers[:]) = fields[2:10]
+        self.call_stack[:] = array('H', fields[10:10 + self.stack_size])
+        self.memory.update(fields[-2])
+        self.screen.load_bytes(fields[-1])
+        if hasattr(self.keypad, 'held'):
+            self.keypad.held = held_keys
+
     @staticmethod
     def bcd(x: int) -> tuple:
         x &= 0xff
@@ -232,79 +423,106 @@ class CPU(object):
         c = math.floor(x / 100)
         return c, b, a
 
+    def tick(self):
+        # Called by the scheduler once per 60 Hz frame
+        self.clock.tick()
+
     def inc_pc(self):
         self.pc += 2
 
+    @property
+    def stack(self):
+        return self.call_stack[:self.sp].tolist()
+
+    @stack.setter
+    def stack(self, addresses):
+        if len(addresses) > self.stack_size:
+            raise OverflowError('Stack overflow')
+        self.call_stack[:len(addresses)] = array('H', addresses)
+        self.sp = len(addresses)
+
     def push_stack(self):
-        self.stack.append(self.pc)
+        if self.sp == self.stack_size:
+            raise OverflowError('Stack overflow')
+        self.call_stack[self.sp] = self.pc
+        self.sp += 1
 
     def pop_stack(self):
-        self.pc = self.stack.pop()
+        if self.sp == 0:
+            raise IndexError('Stack underflow')
+        self.sp -= 1
+        self.pc = self.call_stack[self.sp]
 
     def bool_vf(self, b):
-        self.vf.value = 1 if b else 0
+        self.registers[0xf] = 1 if b else 0
 
     def unsupported_operation(self, inst):
         raise NotImplementedError('No instruction for: {0:x}'.format(inst.data))
 
     def store_nn_in_vx(self, inst):
-        self.v[inst.x].value = inst.nn
+        self.registers[inst.x] = inst.nn
         self.inc_pc()
 
     def store_vy_in_vx(self, inst):
-        self.v[inst.x].value = self.v[inst.y].value
+        self.registers[inst.x] = self.registers[inst.y]
         self.inc_pc()
 
     def add_nn_to_vx(self, inst):
-        self.v[inst.x].value += inst.nn
+        self.registers[inst.x] = (self.registers[inst.x] + inst.nn) & 0xff
         self.inc_pc()
 
     def add_vy_to_vx(self, inst):
-        vx = self.v[inst.x]
-        vx_pre_op = vx.value
-        vx.value += self.v[inst.y].value
-        self.bool_vf(vx < vx_pre_op)
+        v = self.registers
+        vx_pre_op = v[inst.x]
+        v[inst.x] = (vx_pre_op + v[inst.y]) & 0xff
+        self.bool_vf(v[inst.x] < vx_pre_op)
         self.inc_pc()
 
     def subtract_vy_from_vx(self, inst):
-        vx_pre_op = self.v[inst.x].value
-        self.v[inst.x].value -= self.v[inst.y].value
-        self.bool_vf(self.v[inst.x].value > vx_pre_op)
+        v = self.registers
+        vx_pre_op = v[inst.x]
+        v[inst.x] = (vx_pre_op - v[inst.y]) & 0xff
+        self.bool_vf(v[inst.x] > vx_pre_op)
         self.inc_pc()
 
     def store_vy_sub_vx_in_vx(self, inst):
         # http://devernay.free.fr/hacks/chip8/C8TECH10.HTM#8xy7
-        vy_pre_op = self.v[inst.y].value
-        self.v[inst.y].value = self.v[inst.x].value - vy_pre_op # todo: This looks wrong!!!
-        self.bool_vf(self.v[inst.y].value > vy_pre_op)
+        v = self.registers
+        vy_pre_op = v[inst.y]
+        v[inst.y] = (v[inst.x] - vy_pre_op) & 0xff # todo: This looks wrong!!!
+        self.bool_vf(v[inst.y] > vy_pre_op)
         self.inc_pc()
 
     def vx_and_vy_store_in_vx(self, inst):
-        self.v[inst.x].value = self.v[inst.y].value & self.v[inst.x].value
+        v = self.registers
+        v[inst.x] = v[inst.y] & v[inst.x]
         self.inc_pc()
 
     def vx_or_vy_store_in_vx(self, inst):
-        self.v[inst.x].value = self.v[inst.y].value | self.v[inst.x].value
+        v = self.registers
+        v[inst.x] = v[inst.y] | v[inst.x]
         self.inc_pc()
 
     def vx_xor_vy_store_in_vx(self, inst):
-        self.v[inst.x].value = self.v[inst.y].value ^ self.v[inst.x].value
+        v = self.registers
+        v[inst.x] = v[inst.y] ^ v[inst.x]
         self.inc_pc()
 
     def shift_vy_right_store_in_vx(self, inst):
-        vy_value = self.v[inst.y].value
-        self.vf.value = vy_value & 1
-        new_vx = vy_value >> 1
-        self.v[inst.x].value = new_vx
+        v = self.registers
+        vy_value = v[inst.y]
+        v[0xf] = vy_value & 1
+        v[inst.x] = vy_value >> 1
         self.inc_pc()
 
     def shift_vy_left_store_in_vx(self, inst):
-        self.vf.value = 1 if self.v[inst.y].value & 0x80 else 0
-        self.v[inst.x].value = self.v[inst.y].value << 1
+        v = self.registers
+        v[0xf] = 1 if v[inst.y] & 0x80 else 0
+        v[inst.x] = (v[inst.y] << 1) & 0xff
         self.inc_pc()
 
     def set_vx_random_masked(self, inst):
-        self.v[inst.x].value = random.randint(0, 255) & inst.nn
+        self.registers[inst.x] = self.random.randint(0, 255) & inst.nn
         self.inc_pc()
 
     def _set_pc_new_address(self, x):
@@ -314,7 +532,7 @@ class CPU(object):
         self._set_pc_new_address(inst.nnn)
 
     def jump_to_nnn_plus_v0(self, inst):
-        self._set_pc_new_address(inst.nnn + self.v[0].value)
+        self._set_pc_new_address(inst.nnn + self.registers[0])
 
     def exec_subroutine(self, inst):
         self.push_stack()
@@ -330,64 +548,58 @@ class CPU(object):
         self.inc_pc()
 
     def skip_vx_eq_nn(self, inst):
-        self._double_inc_pc_when(self.v[inst.x] == inst.nn)
+        self._double_inc_pc_when(self.registers[inst.x] == inst.nn)
 
     def skip_vx_eq_vy(self, inst):
-        self._double_inc_pc_when(self.v[inst.x] == self.v[inst.y])
+        self._double_inc_pc_when(self.registers[inst.x] == self.registers[inst.y])
 
     def skip_vx_neq_nn(self, inst):
-        self._double_inc_pc_when(self.v[inst.x] != inst.nn)
+        self._double_inc_pc_when(self.registers[inst.x] != inst.nn)
 
     def skip_vx_neq_vy(self, inst):
-        self._double_inc_pc_when(self.v[inst.x] != self.v[inst.y])
+        self._double_inc_pc_when(self.registers[inst.x] != self.registers[inst.y])
 
     def set_delay_timer(self, inst: Instruction):
-        self.delay_timer.value = self.v[inst.x]
+        self.delay_timer.value = self.registers[inst.x]
         self.inc_pc()
 
     def set_sound_timer(self, inst: Instruction):
-        self.sound_timer.value = self.v[inst.x]
+        self.sound_timer.value = self.registers[inst.x]
         self.inc_pc()
 
     def delay_timer_to_vx(self, inst: Instruction):
-        self.v[inst.x].value = self.delay_timer.value
+        self.registers[inst.x] = self.delay_timer.value & 0xff
         self.inc_pc()
 
     def store_nnn_in_i(self, inst: Instruction):
-        self.i.value = inst.nnn
+        self.index_register = inst.nnn
         self.inc_pc()
 
     def add_vx_to_i(self, inst: Instruction):
-        self.i.value = self.v[inst.x].value + self.i.value
+        self.index_register = (self.registers[inst.x] + self.index_register) & 0xfff
         self.inc_pc()
 
     def convert_vx_to_bcd(self, inst: Instruction):
-        if self.i.value + 2 >= len(self.memory):
-            x = self.bcd(self.v[inst.x].value)
-            self.memory[self.i.value + 0] = x[0]
-            self.memory[self.i.value + 1] = x[1]
-            self.memory[self.i.value + 2] = x[2]
+        if self.index_register + 2 < len(self.memory):
+            self.memory.write(self.index_register, self.bcd(self.registers[inst.x]))
         self.inc_pc()
 
     def v0_to_vx_to_memory(self, inst: Instruction):
-        for i, v in enumerate(self.v):
-            self.memory[self.i.value + i] = v.value
-            if i == inst.x:
-                break
+        self.memory.write(self.index_register, self.registers[:inst.x + 1])
         # self.i.value += inst.x + 1
         self.inc_pc()
 
     def memory_to_v0_to_vx(self, inst: Instruction):
-        for i, v in enumerate(self.v):
-            v.value = self.memory[self.i.value + i]
-            if i == inst.x:
-                break
+        end = self.index_register + inst.x + 1
+        if end > len(self.memory):
+            raise IndexError('Read of V0-V{:X} at {:#x} is out of bounds'.format(inst.x, self.index_register))
+        self.registers[:inst.x + 1] = self.memory.view(self.index_register, end)
         # self.i.value += inst.x + 1
         self.inc_pc()
 
     def draw_sprite(self, inst: Instruction):
-        sprite_data = self.memory[self.i.value:self.i.value + inst.n]
-        new_vf = self.screen.write_sprite(self.v[inst.x].value, self.v[inst.y].value, sprite_data)
+        sprite_data = self.memory.view(self.index_register, self.index_register + inst.n)
+        new_vf = self.screen.write_sprite(self.registers[inst.x], self.registers[inst.y], sprite_data)
         self.bool_vf(new_vf)
         self.inc_pc()
 
@@ -396,54 +608,55 @@ class CPU(object):
         self.inc_pc()
 
     def set_i_to_font_for_vx(self, inst: Instruction):
-        self.i.value = self.memory.sprite_for_int(self.v[inst.x].value)
+        self.index_register = self.memory.sprite_for_int(self.registers[inst.x]) & 0xfff
         self.inc_pc()
 
     def wait_for_keypad_store_in_vx(self, inst: Instruction):
         key_value = self.keypad.read_key()
         if key_value is not None:
-            self.v[inst.x].value = key_value
+            self.registers[inst.x] = key_value
             self.inc_pc()
 
     def skip_if_vx_eq_key_pressed(self, inst: Instruction):
-        self._double_inc_pc_when(self.v[inst.x].value == self.keypad.read_key())
+        self._double_inc_pc_when(self.keypad.is_pressed(self.registers[inst.x]))
 
     def skip_if_vx_neq_key_pressed(self, inst: Instruction):
-        self._double_inc_pc_when(self.v[inst.x].value != self.keypad.read_key())
+        self._double_inc_pc_when(not self.keypad.is_pressed(self.registers[inst.x]))
 
     ###################################################################
 
-    def fetch_instruction(self):
-        logger.debug('Fetched instruction from %#x', self.pc)
-        return ((self.memory[self.pc]) << 8) | (self.memory[self.pc + 1])
+    def fetch_instruction(self, address=None):
+        if address is None:
+            address = self.pc
+        return ((self.memory[address]) << 8) | (self.memory[address + 1])
 
     @staticmethod
     def decode_instruction(data):
         return Instruction(data)
 
     def execute_instruction(self, inst: Instruction):
-        logger.debug('V Registers: %s', self.v)
-        logger.debug('I Register: %s', self.i)
-        logger.debug('Stack: %s', self.stack)
-        for handler in self.supported_operations:
-            success = handler(inst)
-            if success:
-                return
-        self.unsupported_operation(inst)
+        operations = self.operations
+        operations.handlers[operations.index[inst.data]](inst)
+
 
+    def step(self):
+        handler, inst = self.decoded_instructions.entries[self.pc] or self.decoded_instructions.decode(self.pc)
+        handler(inst)
+        self.cycles += 1
+
+    def run(self, cycles):
+        for _ in range(cycles):
+            self.step()
+        return cycles
 
     def __call__(self, x=None):
-        if isinstance(x, int):
+        if x is None:
+            self.step()
+        elif isinstance(x, int):
             self.execute_instruction(
                 self.decode_instruction(x)
             )
         elif isinstance(x, Instruction):
             self.execute_instruction(x)
-        elif x is None:
-            self.execute_instruction(
-                self.decode_instruction(
-                    self.fetch_instruction()
-                )
-            )
         else:
             raise TypeError
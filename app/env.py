@@ -0,0 +1,82 @@
+# A gym style environment for driving a ROM from a training loop. Requires
+# numpy, which is not a dependency of the emulator itself.
+#
+#     env = Chip8Env('rom.ch8')
+#     observation = env.reset(seed=0)
+#     observation, reward, done, info = env.step(0x5, frame_skip=4)
+#
+# An action is the key to hold for the step, or None for no key. Each frame
+# runs a frame's worth of instructions against a CycleClock, so runs are
+# reproducible for a given seed and sequence of actions.
+#
+# The observation is a read only view of the framebuffer, the same array on
+# every call, and is updated in place as the ROM draws. Copy it to keep it.
+
+import os
+
+from .batch import make_runner
+from .clock import CycleClock, DEFAULT_IPS
+from .cpu import CPU
+from .keypad import VirtualKeypad
+from .numpy_screen import NumpyScreen
+from .screen import FRAME_RATE, SCREEN_HEIGHT
+
+
+class Chip8Env:
+
+    def __init__(self, rom, ips=DEFAULT_IPS, frame_rate=FRAME_RATE, engine='interpreter', reward=None):
+        # rom is a path or the program itself. reward, if given, is called
+        # with the env after every step and returns the reward for it.
+        self.ips = ips
+        self.frame_rate = frame_rate
+        self.reward = reward
+        self.keypad = VirtualKeypad()
+        self.screen = NumpyScreen()
+        self.cpu = CPU(self.screen, self.keypad, CycleClock(ips, frame_rate))
+        if isinstance(rom, (str, os.PathLike)):
+            self.cpu.load_program_file(rom)
+        else:
+            self.cpu.load_program(rom)
+        self.run = make_runner(self.cpu, engine)
+        self.initial_state = self.cpu.snapshot()
+        self.observation = self.screen.frame_view()
+        self.frames = 0
+        self.done = False
+        self.info = {'frames': 0, 'cycles': 0, 'error': None}
+        # Kept in units of 1/frame_rate cycles, as in the Scheduler
+        self._cycle_budget = 0
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.cpu.seed(seed)
+        self.cpu.restore(self.initial_state)
+        self.frames = 0
+        self.done = False
+        self.info.update(frames=0, cycles=0, error=None)
+        self._cycle_budget = 0
+        return self.observation
+
+    def step(self, action=None, frame_skip=1):
+        if self.done:
+            raise RuntimeError('step() called on a finished episode; call reset() first')
+        self.keypad.held = 0 if action is None else 1 << action
+        cpu = self.cpu
+        try:
+            for _ in range(frame_skip):
+                self._cycle_budget += self.ips
+                batch = self._cycle_budget // self.frame_rate
+                self._cycle_budget -= self.run(batch) * self.frame_rate
+                cpu.tick()
+                self.frames += 1
+        except (NotImplementedError, IndexError, OverflowError) as e:
+            self.done = True
+            self.info['error'] = '{}: {}'.format(type(e).__name__, e)
+
+        info = self.info
+        info['frames'] = self.frames
+        info['cycles'] = cpu.cycles
+        reward = self.reward(self) if self.reward is not None else 0.0
+        return self.observation, reward, self.done, info
+
+    def render(self) -> str:
+        return '\n'.join(self.screen.row_string(y) for y in range(SCREEN_HEIGHT))
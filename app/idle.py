@@ -0,0 +1,112 @@
+# Recognises the loops ROMs wait in and fast-forwards through them.
+#
+# Three patterns are detected at the current PC:
+#
+#   1NNN jumping to itself        - nothing can change, ever
+#   FX0A with no key held         - nothing changes until a key is pressed
+#   FX07, 3X00, 1NNN back to FX07 - spins until the delay timer reaches 0
+#
+# Keys and wall clock timers only change between frames, so skipping the
+# cycles these loops would have spent leaves the machine in exactly the
+# state running them would have: the same PC and registers, with cycles
+# counted as executed. Skipped cycles are not seen by the profiler or the
+# tracer.
+
+# Instructions to run between checks for an idle loop
+CHECK_INTERVAL = 64
+# Cycles per iteration of the delay timer polling loop
+TIMER_LOOP_LENGTH = 3
+
+
+class IdleSkipper:
+    # Wraps a runner, e.g. cpu.run, to skip idle loops. idle is set when the
+    # last call ended waiting for something that only happens between
+    # frames, so the caller can sleep instead of calling again.
+
+    def __init__(self, cpu, run=None, check_interval=CHECK_INTERVAL):
+        self.cpu = cpu
+        self.run = run or cpu.run
+        self.check_interval = check_interval
+        self.idle = False
+        self.skipped_cycles = 0
+
+    def __call__(self, cycles):
+        executed = 0
+        self.idle = False
+        while executed < cycles:
+            skipped = self.skip(cycles - executed)
+            if skipped:
+                executed += skipped
+                self.skipped_cycles += skipped
+                continue
+            # At or part way round a timer loop, only run to its end or its
+            # start, so whatever comes next is checked straight away
+            if self._timer_loop_register(self.cpu.pc) is not None:
+                chunk = TIMER_LOOP_LENGTH
+            elif self._timer_loop_register(self.cpu.pc - 2) is not None:
+                chunk = 2
+            elif self._timer_loop_register(self.cpu.pc - 4) is not None:
+                chunk = 1
+            else:
+                chunk = self.check_interval
+            executed += self.run(min(chunk, cycles - executed))
+        return executed
+
+    def _opcode(self, address):
+        memory = self.cpu.memory
+        if 0 <= address and address + 1 < len(memory):
+            return memory[address] << 8 | memory[address + 1]
+        return None
+
+    def _timer_loop_register(self, start):
+        # X if start begins an FX07, 3X00, 1NNN loop, otherwise None
+        opcode = self._opcode(start)
+        if opcode is None or opcode & 0xf0ff != 0xf007:
+            return None
+        x = opcode >> 8 & 0xf
+        if self._opcode(start + 2) == 0x3000 | x << 8 and self._opcode(start + 4) == 0x1000 | start:
+            return x
+        return None
+
+    def skip(self, cycles):
+        # Fast-forwards through up to cycles of an idle loop at the PC,
+        # returning how many were skipped
+        cpu = self.cpu
+        opcode = self._opcode(cpu.pc)
+        if opcode is None:
+            return 0
+        if opcode == 0x1000 | cpu.pc or (opcode & 0xf0ff == 0xf00a and cpu.keypad.read_key() is None):
+            cpu.cycles += cycles
+            self.idle = True
+            return cycles
+        x = self._timer_loop_register(cpu.pc)
+        if x is not None:
+            return self._skip_timer_loop(x, cycles)
+        return 0
+
+    def _skip_timer_loop(self, x, cycles):
+        # Skips the iterations that would read a non-zero delay timer. The
+        # timer only counts down, so that is a prefix of them.
+        cpu = self.cpu
+        start = cpu.cycles
+
+        def delay_at(cycle):
+            cpu.cycles = cycle
+            return cpu.delay_timer.value & 0xff
+
+        low, high = 0, cycles // TIMER_LOOP_LENGTH
+        while low < high:
+            middle = (low + high + 1) // 2
+            if delay_at(start + (middle - 1) * TIMER_LOOP_LENGTH):
+                low = middle
+            else:
+                high = middle - 1
+        iterations = low
+
+        if iterations:
+            cpu.registers[x] = delay_at(start + (iterations - 1) * TIMER_LOOP_LENGTH)
+        cpu.cycles = start + iterations * TIMER_LOOP_LENGTH
+        # Out of budget before the timer ran out; with a wall clock that is
+        # always the case, as it only ticks between frames
+        self.idle = iterations * TIMER_LOOP_LENGTH > cycles - TIMER_LOOP_LENGTH
+        return iterations * TIMER_LOOP_LENGTH
@@ -0,0 +1,186 @@
+# Translates straight-line runs of CHIP-8 code into Python functions.
+#
+# A block starts at some address and keeps going until it hits something that
+# can change control flow, block on input, draw or access memory. Everything
+# before that point is compiled into plain local variable arithmetic, and the
+# terminating instruction is handed to the interpreter's own handler.
+
+import re
+from collections import defaultdict
+
+MAX_BLOCK_LENGTH = 64
+
+_REGISTER_NAME = re.compile(r'\bv[0-9a-f]\b')
+_ASSIGNED_NAME = re.compile(r'^(v[0-9a-f]|i) = ')
+
+
+# Keyed on OperationDefinition.str. Each entry mirrors the matching CPU
+# handler exactly, including the order registers are read and written in.
+STRAIGHT_LINE_OPERATIONS = {
+    '6XNN': lambda x, y, nn, nnn: ['v{x:x} = {nn}'.format(x=x, nn=nn)],
+    '8XY0': lambda x, y, nn, nnn: ['v{x:x} = v{y:x}'.format(x=x, y=y)],
+    '7XNN': lambda x, y, nn, nnn: ['v{x:x} = (v{x:x} + {nn}) & 0xff'.format(x=x, nn=nn)],
+    '8XY4': lambda x, y, nn, nnn: [
+        't = v{x:x}'.format(x=x),
+        'v{x:x} = (v{x:x} + v{y:x}) & 0xff'.format(x=x, y=y),
+        'vf = 1 if v{x:x} < t else 0'.format(x=x),
+    ],
+    '8XY5': lambda x, y, nn, nnn: [
+        't = v{x:x}'.format(x=x),
+        'v{x:x} = (v{x:x} - v{y:x}) & 0xff'.format(x=x, y=y),
+        'vf = 1 if v{x:x} > t else 0'.format(x=x),
+    ],
+    '8XY7': lambda x, y, nn, nnn: [
+        't = v{y:x}'.format(y=y),
+        'v{y:x} = (v{x:x} - t) & 0xff'.format(x=x, y=y),
+        'vf = 1 if v{y:x} > t else 0'.format(y=y),
+    ],
+    '8XY2': lambda x, y, nn, nnn: ['v{x:x} = v{y:x} & v{x:x}'.format(x=x, y=y)],
+    '8XY1': lambda x, y, nn, nnn: ['v{x:x} = v{y:x} | v{x:x}'.format(x=x, y=y)],
+    '8XY3': lambda x, y, nn, nnn: ['v{x:x} = v{y:x} ^ v{x:x}'.format(x=x, y=y)],
+    '8XY6': lambda x, y, nn, nnn: [
+        't = v{y:x}'.format(y=y),
+        'vf = t & 1',
+        'v{x:x} = t >> 1'.format(x=x),
+    ],
+    '8XYE': lambda x, y, nn, nnn: [
+        'vf = 1 if v{y:x} & 0x80 else 0'.format(y=y),
+        'v{x:x} = (v{y:x} << 1) & 0xff'.format(x=x, y=y),
+    ],
+    'CXNN': lambda x, y, nn, nnn: ['v{x:x} = cpu.random.randint(0, 255) & {nn}'.format(x=x, nn=nn)],
+    'ANNN': lambda x, y, nn, nnn: ['i = {nnn}'.format(nnn=nnn)],
+    'FX1E': lambda x, y, nn, nnn: ['i = (v{x:x} + i) & 0xfff'.format(x=x)],
+    'FX29': lambda x, y, nn, nnn: ['i = (v{x:x} * 5) & 0xfff'.format(x=x)],
+    'FX15': lambda x, y, nn, nnn: ['cpu.delay_timer.value = v{x:x}'.format(x=x)],
+    'FX18': lambda x, y, nn, nnn: ['cpu.sound_timer.value = v{x:x}'.format(x=x)],
+    'FX07': lambda x, y, nn, nnn: ['v{x:x} = cpu.delay_timer.value & 0xff'.format(x=x)],
+}
+
+# Operations that read the clock, which a CycleClock derives from cpu.cycles
+TIMER_OPERATIONS = ('FX15', 'FX18', 'FX07')
+
+
+class Block:
+
+    def __init__(self, start, length, fn, source):
+        self.start = start
+        self.length = length
+        self.stop = start + length * 2
+        self.fn = fn
+        self.source = source
+
+
+class BlockTranslator:
+
+    def __init__(self, cpu, max_block_length=MAX_BLOCK_LENGTH):
+        self.cpu = cpu
+        self.max_block_length = max_block_length
+        self.blocks = {}
+        self.owners = defaultdict(set)
+        cpu.memory.observers.append(self.invalidate)
+
+    def decode_block(self, start):
+        memory = self.cpu.memory
+        body = []
+        terminator = None
+        address = start
+        while len(body) < self.max_block_length and address + 1 < len(memory):
+            opcode = (memory[address] << 8) | memory[address + 1]
+            definition = self.cpu.operations.lookup(opcode)
+            if definition is None or definition.str not in STRAIGHT_LINE_OPERATIONS:
+                terminator = (address, opcode)
+                break
+            body.append((address, opcode, definition))
+            address += 2
+        return body, terminator
+
+    def generate(self, start, body, terminator):
+        lines = []
+        # Instructions already added to cpu.cycles
+        counted = 0
+        for k, (_, opcode, definition) in enumerate(body):
+            if definition.str in TIMER_OPERATIONS and k > counted:
+                lines.append('cpu.cycles += {}'.format(k - counted))
+                counted = k
+            lines += STRAIGHT_LINE_OPERATIONS[definition.str](
+                x=(opcode & 0x0f00) >> 8, y=(opcode & 0x00f0) >> 4, nn=opcode & 0x00ff, nnn=opcode & 0x0fff)
+
+        registers = sorted(set(_REGISTER_NAME.findall('\n'.join(lines))))
+        assigned = set(m.group(1) for m in map(_ASSIGNED_NAME.match, lines) if m)
+        uses_i = any(re.search(r'\bi\b', line) for line in lines)
+
+        prologue = ['v = cpu.registers']
+        prologue += ['{0} = v[{1}]'.format(r, int(r[1], 16)) for r in registers]
+        if uses_i:
+            prologue.append('i = cpu.index_register')
+
+        epilogue = ['v[{1}] = {0}'.format(r, int(r[1], 16)) for r in registers if r in assigned]
+        if 'i' in assigned:
+            epilogue.append('cpu.index_register = i')
+
+        length = len(body)
+        if terminator is None:
+            epilogue.append('cpu.pc = {:#x}'.format(start + length * 2))
+            epilogue.append('cpu.cycles += {}'.format(length - counted))
+        else:
+            # The terminator's cycle is only counted once it has run, as in
+            # CPU.step, so a fault leaves the same state behind
+            epilogue.append('cpu.pc = {:#x}'.format(terminator[0]))
+            if length > counted:
+                epilogue.append('cpu.cycles += {}'.format(length - counted))
+            epilogue.append('terminator(terminator_instruction)')
+            epilogue.append('cpu.cycles += 1')
+            length += 1
+        epilogue.append('return {}'.format(length))
+
+        source = 'def block_{:03x}(cpu):\n'.format(start)
+        source += ''.join('    {}\n'.format(line) for line in prologue + lines + epilogue)
+        return source, length
+
+    def translate(self, start):
+        if start + 1 >= len(self.cpu.memory):
+            raise IndexError('Cannot translate code at {:#x}'.format(start))
+        body, terminator = self.decode_block(start)
+        source, length = self.generate(start, body, terminator)
+        namespace = {}
+        if terminator is not None:
+            inst = self.cpu.decode_instruction(terminator[1])
+            namespace['terminator'] = self.cpu.operations[inst.data]
+            namespace['terminator_instruction'] = inst
+        exec(compile(source, '<chip8 block {:#x}>'.format(start), 'exec'), namespace)
+        block = Block(start, length, namespace['block_{:03x}'.format(start)], source)
+        self.blocks[start] = block
+        for address in range(block.start, block.stop):
+            self.owners[address].add(start)
+        return block
+
+    def invalidate(self, start, stop):
+        if stop - start > len(self.owners):
+            addresses = [address for address in self.owners if start <= address < stop]
+        else:
+            addresses = range(start, stop)
+        for address in addresses:
+            for block_start in self.owners.pop(address, ()):
+                block = self.blocks.pop(block_start, None)
+                if block is not None:
+                    for owned in range(block.start, block.stop):
+                        self.owners[owned].discard(block_start)
+
+    def clear(self):
+        self.blocks.clear()
+        self.owners.clear()
+
+    def run(self, cycles):
+        # Runs exactly the given number of cycles, interpreting the tail of a
+        # block that would overshoot
+        cpu = self.cpu
+        blocks = self.blocks
+        executed = 0
+        while executed < cycles:
+            block = blocks.get(cpu.pc) or self.translate(cpu.pc)
+            if block.length <= cycles - executed:
+                executed += block.fn(cpu)
+            else:
+                cpu.step()
+                executed += 1
+        return executed
@@ -1,7 +1,3 @@
-import logging
-
-logger = logging.getLogger(__name__)
-
 KEY_MAPPING = {
     '1': 0x1,
     '2': 0x2,
@@ -21,18 +17,101 @@ KEY_MAPPING = {
     'v': 0xf,
 }
 
+# Emulator controls, handled by Keypad.poll() rather than passed to the ROM
+REWIND_KEY = 'b'
+# Terminals only report presses, repeating them while a key is held, so a
+# key counts as released once this many frames pass without one
+HOLD_FRAMES = 10
+
+
+class VirtualKeypad:
+    # Held keys are kept in a 16 bit bitmap, bit N being key N
+
+    def __init__(self):
+        self.held = 0
 
-class Keypad:
+    def press(self, key: int):
+        self.held |= 1 << key
+
+    def release(self, key: int):
+        self.held &= ~(1 << key)
+
+    def poll(self):
+        # Called once per frame; held only changes when told to
+        pass
+
+    def is_pressed(self, key: int) -> bool:
+        return bool(self.held >> key & 1)
+
+    def read_key(self):
+        if not self.held:
+            return None
+        return (self.held & -self.held).bit_length() - 1
 
-    def __init__(self, stdscr):
+
+class ScriptedKeypad(VirtualKeypad):
+    # Replays (cycle, key, pressed) events. update() must be called with the
+    # CPU's cycle count to apply everything that is due.
+
+    def __init__(self, events=()):
+        super(ScriptedKeypad, self).__init__()
+        self.events = sorted((cycle, key, bool(pressed)) for cycle, key, pressed in events)
+        self.position = 0
+
+    @property
+    def next_event_cycle(self):
+        if self.position < len(self.events):
+            return self.events[self.position][0]
+        return None
+
+    def update(self, cycle: int):
+        while self.position < len(self.events) and self.events[self.position][0] <= cycle:
+            _, key, pressed = self.events[self.position]
+            if pressed:
+                self.press(key)
+            else:
+                self.release(key)
+            self.position += 1
+
+
+class Keypad(VirtualKeypad):
+    # Reads curses input once per frame into the held bitmap, so the key
+    # opcodes never touch the terminal
+
+    def __init__(self, stdscr, hold_frames=HOLD_FRAMES):
+        super(Keypad, self).__init__()
+        import curses
         self.stdscr = stdscr
+        self.curses_error = curses.error
         stdscr.nodelay(True)
+        self.hold_frames = hold_frames
+        self.hotkeys = {}
+        self.frame = 0
+        # Frame each held key is released on, unless pressed again first
+        self.release_frames = [0] * 16
 
-    def read_key(self):
+    def _getkey(self):
         try:
-            key = self.stdscr.getkey()
-        except:
-            key = None
-        return_value = KEY_MAPPING.get(key, None)
-        logger.debug('Returning value %s', return_value)
-        return return_value
+            return self.stdscr.getkey()
+        except self.curses_error:
+            return None
+
+    def poll(self):
+        # Called once per frame, between instructions. Drains all pending
+        # input, runs hotkeys and releases keys that have timed out.
+        self.frame += 1
+        hotkeys = []
+        while True:
+            key = self._getkey()
+            if key is None:
+                break
+            elif key in self.hotkeys:
+                hotkeys.append(key)
+            elif key in KEY_MAPPING:
+                self.press(KEY_MAPPING[key])
+                self.release_frames[KEY_MAPPING[key]] = self.frame + self.hold_frames
+        for key in range(16):
+            if self.held >> key & 1 and self.release_frames[key] <= self.frame:
+                self.release(key)
+        for key in hotkeys:
+            self.hotkeys[key]()
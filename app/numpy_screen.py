@@ -0,0 +1,61 @@
+# Optional framebuffer backend for analysis pipelines. Requires numpy, which is
+# not a dependency of the emulator itself.
+
+import numpy as np
+
+from .screen import VirtualScreen, SCREEN_WIDTH, SCREEN_HEIGHT
+
+
+class NumpyScreen(VirtualScreen):
+    # frame is a (SCREEN_HEIGHT, SCREEN_WIDTH) uint8 array of 0s and 1s. It is
+    # only ever modified in place, so views handed out by it stay current.
+
+    def _write_pixels(self):
+        if hasattr(self, 'frame'):
+            self.frame.fill(0)
+        else:
+            self.frame = np.zeros((SCREEN_HEIGHT, SCREEN_WIDTH), dtype=np.uint8)
+
+    @property
+    def rows(self):
+        packed = np.packbits(self.frame, axis=1)
+        return [int.from_bytes(row.tobytes(), 'big') for row in packed]
+
+    def to_bytes(self) -> bytes:
+        return np.packbits(self.frame).tobytes()
+
+    def load_bytes(self, data: bytes):
+        self.frame[...] = np.unpackbits(np.frombuffer(data, dtype=np.uint8)).reshape(self.frame.shape)
+
+    def pixel(self, x: int, y: int) -> bool:
+        return bool(self.frame[y, x])
+
+    def write_sprite(self, x, y, sprite_data) -> bool:
+        x %= SCREEN_WIDTH
+        y %= SCREEN_HEIGHT
+        sprite = np.asarray(sprite_data[:15], dtype=np.uint8)
+        bits = np.unpackbits(sprite).reshape(-1, 8)
+
+        if self.wrap:
+            index = np.ix_((y + np.arange(len(bits))) % SCREEN_HEIGHT, (x + np.arange(8)) % SCREEN_WIDTH)
+            region = self.frame[index]
+            collision = np.any(region & bits)
+            self.frame[index] = region ^ bits
+        else:
+            bits = bits[:SCREEN_HEIGHT - y, :SCREEN_WIDTH - x]
+            region = self.frame[y:y + bits.shape[0], x:x + bits.shape[1]]
+            collision = np.any(region & bits)
+            region ^= bits
+        return bool(collision)
+
+    def write_pixel(self, x: int, y: int, on=False) -> bool:
+        if not on or x >= SCREEN_WIDTH or y >= SCREEN_HEIGHT:
+            return False
+        previous_pixel_value = bool(self.frame[y, x])
+        self.frame[y, x] ^= 1
+        return previous_pixel_value
+
+    def frame_view(self, dtype=np.uint8) -> np.ndarray:
+        view = self.frame.view(dtype)
+        view.flags.writeable = False
+        return view
@@ -0,0 +1,117 @@
+# Counts and times every instruction the CPU executes, per operation, and
+# keeps a histogram of the addresses they were executed from.
+#
+#     with Profiler(cpu) as profiler:
+#         cpu.run(100000)
+#     print(profiler.report())
+#
+# While running, each handler in the CPU's OperationTable is swapped for a
+# wrapper; stopping puts the originals back, so an idle profiler costs
+# nothing. This profiles the interpreter: blocks compiled by the translator
+# never go through the table.
+
+import time
+
+
+class Profiler:
+
+    def __init__(self, cpu):
+        self.cpu = cpu
+        slots = len(cpu.operations.handlers)
+        self.counts = [0] * slots
+        self.seconds = [0.0] * slots
+        self.pc_counts = [0] * len(cpu.memory)
+        self._original_handlers = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def running(self):
+        return self._original_handlers is not None
+
+    def start(self):
+        if self.running:
+            return
+        handlers = self.cpu.operations.handlers
+        self._original_handlers = list(handlers)
+        handlers[:] = [self._wrap(i, handler) for i, handler in enumerate(handlers)]
+        self.cpu.decoded_instructions.clear()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.cpu.operations.handlers[:] = self._original_handlers
+        self._original_handlers = None
+        self.cpu.decoded_instructions.clear()
+
+    def _wrap(self, slot, handler):
+        cpu = self.cpu
+        counts = self.counts
+        seconds = self.seconds
+        pc_counts = self.pc_counts
+        perf_counter = time.perf_counter
+
+        def profiled(inst):
+            pc_counts[cpu.pc] += 1
+            started = perf_counter()
+            try:
+                handler(inst)
+            finally:
+                seconds[slot] += perf_counter() - started
+                counts[slot] += 1
+        return profiled
+
+    def operation_stats(self):
+        # One row per operation that ran, slowest in total first. probes is
+        # how many definitions a linear scan of supported_operations would
+        # have tried before this one matched; the dispatch table needs one.
+        definitions = self.cpu.operations.definitions
+        total_seconds = sum(self.seconds) or 1.0
+        rows = []
+        for slot, count in enumerate(self.counts):
+            if not count:
+                continue
+            if slot < len(definitions):
+                name, description = definitions[slot].str, definitions[slot].description
+            else:
+                name, description = '????', 'No matching operation'
+            rows.append({
+                'operation': name,
+                'description': description,
+                'count': count,
+                'seconds': self.seconds[slot],
+                'mean_ns': self.seconds[slot] / count * 1e9,
+                'share': self.seconds[slot] / total_seconds,
+                'probes': slot + 1,
+            })
+        return sorted(rows, key=lambda row: -row['seconds'])
+
+    def hot_addresses(self, limit=20):
+        hot = sorted((count, address) for address, count in enumerate(self.pc_counts) if count)
+        return [(address, count) for count, address in reversed(hot[-limit:])]
+
+    def report(self, limit=20):
+        rows = self.operation_stats()
+        instructions = sum(self.counts)
+        lines = ['{} instructions, {:.3f}s in handlers, {} linear scan probes avoided'.format(
+            instructions, sum(self.seconds), sum(r['count'] * (r['probes'] - 1) for r in rows)), '']
+
+        lines.append('{:6} {:>10} {:>10} {:>10} {:>7} {:>6}  {}'.format(
+            'op', 'count', 'total ms', 'mean ns', 'time', 'probes', 'description'))
+        for r in rows:
+            lines.append('{operation:6} {count:>10} {ms:>10.2f} {mean_ns:>10.0f} {share:>7.1%} {probes:>6}  '
+                         '{description}'.format(ms=r['seconds'] * 1e3, **r))
+
+        lines += ['', '{:>7} {:>10} {:>7}  {}'.format('address', 'count', 'opcode', 'operation')]
+        memory = self.cpu.memory
+        for address, count in self.hot_addresses(limit):
+            opcode = (memory[address] << 8) | memory[address + 1] if address + 1 < len(memory) else 0
+            definition = self.cpu.operations.lookup(opcode)
+            lines.append('{:>#7x} {:>10} {:>#7x}  {}'.format(
+                address, count, opcode, definition.str if definition else '????'))
+        return '\n'.join(lines)
@@ -0,0 +1,81 @@
+# Presents the screen from its own thread, so a slow terminal can't hold up
+# emulation.
+#
+# The CPU keeps drawing into Screen.rows, which acts as the back buffer. At
+# each frame boundary swap() copies it into the front buffer, and the render
+# thread presents the newest front buffer it has been handed. If presenting
+# takes longer than a frame, the frames swapped in the meantime are simply
+# never shown.
+#
+# curses isn't thread safe, so anything else that calls into it - polling
+# for input, for one - must hold lock, or go through try_locked().
+
+import threading
+
+from .screen import FRAME_RATE
+
+# How long the render thread waits for a frame before checking for stop()
+STOP_POLL_INTERVAL = 0.1
+
+
+class ThreadedRenderer:
+
+    def __init__(self, screen, frame_rate=FRAME_RATE):
+        self.screen = screen
+        self.frame_rate = frame_rate
+        self.front = list(screen.rows)
+        self.lock = threading.Lock()
+        self.swaps = 0
+        self.presented_frames = 0
+        self._front_lock = threading.Lock()
+        self._frame_ready = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def swap(self):
+        # Called by the CPU's thread once per frame, in place of present()
+        with self._front_lock:
+            self.front[:] = self.screen.rows
+        self.swaps += 1
+        self._frame_ready.set()
+
+    def try_locked(self, callback):
+        # Wraps callback so it only runs if curses is free, rather than
+        # waiting on a frame being presented
+        def locked():
+            if self.lock.acquire(blocking=False):
+                try:
+                    callback()
+                finally:
+                    self.lock.release()
+        return locked
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='renderer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._frame_ready.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            if not self._frame_ready.wait(STOP_POLL_INTERVAL):
+                continue
+            self._frame_ready.clear()
+            with self._front_lock:
+                rows = list(self.front)
+            with self.lock:
+                self.screen.present(rows)
+            self.presented_frames += 1
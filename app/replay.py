@@ -0,0 +1,112 @@
+# Deterministic input recording, and headless replay at full speed.
+#
+# A recording is only reproducible if nothing depends on wall time, so the
+# run being recorded must use a CycleClock and a seeded CPU. Changes in the
+# held keys are then logged against the cycle they were polled on, and
+# replaying them into a ScriptedKeypad reproduces the run exactly.
+#
+#     ./app.py rom.ch8 --record session.json
+#     python -m app.replay session.json rom.ch8
+
+import argparse
+import hashlib
+import json
+import sys
+
+from .batch import run_rom, ENGINES
+
+RECORDING_VERSION = 1
+
+
+def file_sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class RecordingKeypad:
+    # Wraps a keypad, logging every change poll() makes to its held bitmap
+    # as (cycle, key, pressed) events. cycles returns the CPU's cycle count.
+
+    def __init__(self, keypad, cycles):
+        self.keypad = keypad
+        self.cycles = cycles
+        self.events = []
+        self.last_held = keypad.held
+
+    def __getattr__(self, name):
+        return getattr(self.keypad, name)
+
+    def poll(self):
+        self.keypad.poll()
+        held = self.keypad.held
+        changed = held ^ self.last_held
+        if changed:
+            cycle = self.cycles()
+            for key in range(16):
+                if changed >> key & 1:
+                    self.events.append((cycle, key, bool(held >> key & 1)))
+            self.last_held = held
+
+
+class Recording:
+
+    def __init__(self, rom_sha256, seed, ips, events=(), cycles=0, framebuffer_sha256=None):
+        self.rom_sha256 = rom_sha256
+        self.seed = seed
+        self.ips = ips
+        self.events = list(events)
+        self.cycles = cycles
+        self.framebuffer_sha256 = framebuffer_sha256
+
+    @classmethod
+    def finish(cls, cpu, keypad: RecordingKeypad, rom_path, seed, ips):
+        return cls(file_sha256(rom_path), seed, ips, keypad.events, cpu.cycles,
+                   hashlib.sha256(cpu.screen.to_bytes()).hexdigest())
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({
+                'version': RECORDING_VERSION,
+                'rom_sha256': self.rom_sha256,
+                'seed': self.seed,
+                'ips': self.ips,
+                'cycles': self.cycles,
+                'framebuffer_sha256': self.framebuffer_sha256,
+                'events': self.events,
+            }, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        if data.get('version') != RECORDING_VERSION:
+            raise ValueError('Unsupported recording version: {}'.format(data.get('version')))
+        return cls(data['rom_sha256'], data['seed'], data['ips'], [tuple(e) for e in data['events']],
+                   data['cycles'], data['framebuffer_sha256'])
+
+
+def replay(recording: Recording, rom_path, engine='interpreter'):
+    if file_sha256(rom_path) != recording.rom_sha256:
+        raise ValueError('{} is not the ROM this was recorded with'.format(rom_path))
+    report = run_rom(rom_path, cycles=recording.cycles, ips=recording.ips, engine=engine,
+                     key_events=recording.events, seed=recording.seed)
+    report['matches_recording'] = report['framebuffer_sha256'] == recording.framebuffer_sha256
+    report['recorded_seconds'] = recording.cycles / recording.ips
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replays a recorded session headlessly, as fast as possible.')
+    parser.add_argument('recording', help='A recording made with ./app.py --record')
+    parser.add_argument('rom', help='The ROM the recording was made with')
+    parser.add_argument('--engine', choices=ENGINES, default='interpreter')
+    args = parser.parse_args(argv)
+
+    report = replay(Recording.load(args.recording), args.rom, args.engine)
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    return 0 if report['exit_reason'] == 'completed' and report['matches_recording'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
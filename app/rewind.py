@@ -0,0 +1,89 @@
+# Keeps a bounded history of snapshots so execution can be stepped backwards.
+#
+# Only the newest snapshot is stored whole. Every older one is kept as the
+# XOR of itself with its successor, run length encoded - consecutive
+# snapshots are nearly identical, so that is mostly zeros and encodes to a
+# few hundred bytes. Deltas point backwards, which means the oldest can
+# simply fall off the end of the ring buffer.
+
+import re
+import struct
+from collections import deque
+
+DEFAULT_INTERVAL = 10
+DEFAULT_CAPACITY = 3600
+
+# Zero bytes to skip, then how many literal bytes follow
+RUN_HEADER = struct.Struct('<HH')
+_NON_ZERO_RUN = re.compile(b'[^\x00]{1,65535}')
+
+
+def xor_bytes(a: bytes, b: bytes) -> bytes:
+    return (int.from_bytes(a, 'big') ^ int.from_bytes(b, 'big')).to_bytes(len(a), 'big')
+
+
+def rle_encode(data: bytes) -> bytes:
+    encoded = bytearray()
+    position = 0
+    for run in _NON_ZERO_RUN.finditer(data):
+        skip = run.start() - position
+        while skip > 0xffff:
+            encoded += RUN_HEADER.pack(0xffff, 0)
+            skip -= 0xffff
+        encoded += RUN_HEADER.pack(skip, run.end() - run.start())
+        encoded += run.group()
+        position = run.end()
+    return bytes(encoded)
+
+
+def rle_decode(encoded: bytes, size: int) -> bytes:
+    data = bytearray(size)
+    position = 0
+    offset = 0
+    while offset < len(encoded):
+        skip, length = RUN_HEADER.unpack_from(encoded, offset)
+        offset += RUN_HEADER.size
+        position += skip
+        data[position:position + length] = encoded[offset:offset + length]
+        offset += length
+        position += length
+    return bytes(data)
+
+
+class Rewind:
+
+    def __init__(self, cpu, interval=DEFAULT_INTERVAL, capacity=DEFAULT_CAPACITY):
+        self.cpu = cpu
+        self.interval = interval
+        self.deltas = deque(maxlen=capacity)
+        self.latest = None
+        self.frames_since_capture = 0
+
+    def __len__(self):
+        return len(self.deltas) + (self.latest is not None)
+
+    def frame(self):
+        # Called once per frame; captures every interval frames
+        self.frames_since_capture += 1
+        if self.frames_since_capture >= self.interval:
+            self.capture()
+
+    def capture(self):
+        snapshot = self.cpu.snapshot()
+        if self.latest is not None:
+            self.deltas.append(rle_encode(xor_bytes(snapshot, self.latest)))
+        self.latest = snapshot
+        self.frames_since_capture = 0
+
+    def rewind(self) -> bool:
+        # Steps back to the previous capture, or to the only one there is
+        if self.latest is None:
+            return False
+        if self.deltas:
+            self.latest = xor_bytes(self.latest, rle_decode(self.deltas.pop(), len(self.latest)))
+        self.cpu.restore(self.latest)
+        self.frames_since_capture = 0
+        return True
+
+    def memory_usage(self) -> int:
+        return sum(map(len, self.deltas)) + len(self.latest or b'')
@@ -0,0 +1,125 @@
+import logging
+import time
+
+from .clock import DEFAULT_IPS
+from .idle import IdleSkipper
+from .screen import FRAME_RATE
+
+logger = logging.getLogger(__name__)
+
+# How many instructions to run between clock checks when the IPS is unlimited
+UNLIMITED_BATCH_SIZE = 256
+# Once this far behind real time we stop trying to catch up and start afresh
+MAX_LAG = 0.5
+
+
+class Scheduler:
+    # Runs the CPU one 60 Hz frame at a time: a batch of instructions, a timer
+    # tick, one present() and then a sleep for whatever is left of the frame.
+    # ips=None runs as many instructions as fit in each frame. With
+    # skip_idle, idle loops are fast-forwarded rather than executed.
+
+    def __init__(self, cpu, run=None, present=None, ips=DEFAULT_IPS, frame_rate=FRAME_RATE,
+                 clock=time.monotonic, sleep=time.sleep, skip_idle=False):
+        self.cpu = cpu
+        self.run = run or cpu.run
+        self.idle_skipper = None
+        if skip_idle:
+            self.idle_skipper = self.run = IdleSkipper(cpu, self.run)
+        self.present = present
+        self.ips = ips
+        self.frame_rate = frame_rate
+        self.frame_duration = 1 / frame_rate
+        self.clock = clock
+        self.sleep = sleep
+        # Called after the timer tick and before present(), once per frame
+        self.frame_hooks = []
+
+        self.frames = 0
+        self.cycles = 0
+        self.lag = 0.0
+        self.dropped_frames = 0
+        # Kept in units of 1/frame_rate cycles so it never drifts
+        self._cycle_budget = 0
+        self._started_at = None
+        self._next_frame = None
+
+    def run_frame(self):
+        for _ in self._run_cpu_frame():
+            pass
+        if self.present is not None:
+            self.present()
+        self.frames += 1
+
+        remaining = self._time_left()
+        if remaining > 0:
+            self.sleep(remaining)
+
+    def _run_cpu_frame(self):
+        # The CPU's part of a frame: its instructions, the timer tick and the
+        # frame hooks. A generator that yields between batches when the IPS
+        # is unlimited, so the AsyncScheduler can give way to other tasks.
+        self._start_frame()
+        if self.ips is None:
+            # At least one batch, so a frame that starts late still runs some
+            while True:
+                self.cycles += self.run(UNLIMITED_BATCH_SIZE)
+                if self.clock() >= self._next_frame or self._idle():
+                    break
+                yield
+        else:
+            self._run_budget()
+        self._end_frame()
+
+    def _start_frame(self):
+        now = self.clock()
+        if self._next_frame is None:
+            self._started_at = self._next_frame = now
+        self._next_frame += self.frame_duration
+        if self.idle_skipper is not None:
+            self.idle_skipper.idle = False
+
+    def _idle(self):
+        # Only a new frame can end the loop the CPU is waiting in
+        return self.idle_skipper is not None and self.idle_skipper.idle
+
+    def _run_budget(self):
+        self._cycle_budget += self.ips
+        batch = self._cycle_budget // self.frame_rate
+        if batch > 0:
+            executed = self.run(batch)
+            self._cycle_budget -= executed * self.frame_rate
+            self.cycles += executed
+
+    def _end_frame(self):
+        self.cpu.tick()
+        for hook in self.frame_hooks:
+            hook()
+
+    def _time_left(self):
+        # Seconds to sleep until the next frame, updating the lag instead
+        # when there are none
+        remaining = self._next_frame - self.clock()
+        if remaining > 0:
+            self.lag = 0.0
+            return remaining
+        self.lag = -remaining
+        if self.lag > MAX_LAG:
+            logger.warning('Running %.3fs behind real time, skipping ahead', self.lag)
+            self.dropped_frames += int(self.lag / self.frame_duration)
+            self._next_frame = self.clock()
+        return 0.0
+
+    def run_forever(self):
+        while True:
+            self.run_frame()
+
+    def stats(self) -> dict:
+        elapsed = self.clock() - self._started_at if self._started_at is not None else 0.0
+        return {
+            'frames': self.frames,
+            'cycles': self.cycles,
+            'ips': self.cycles / elapsed if elapsed > 0 else 0.0,
+            'lag': self.lag,
+            'dropped_frames': self.dropped_frames,
+        }
@@ -1,4 +1,5 @@
 import logging
+import re
 
 logger = logging.getLogger(__name__)
 
@@ -107,44 +108,79 @@ FONT = [
 ]
 
 
+ROW_MASK = (1 << SCREEN_WIDTH) - 1
+ROW_CHARS = str.maketrans('01', EMPTY_BLOCK_CHAR + FULL_BLOCK_CHAR)
+BIT_FORMAT = '0{}b'.format(SCREEN_WIDTH)
+CHANGED_RUN = re.compile('1+')
+
+FRAME_RATE = 60
+
+
 class VirtualScreen:
+    # Each row is packed into a single int, leftmost pixel in the most
+    # significant bit. Sprites start at their coordinates modulo the screen
+    # size, and are clipped at the edges unless wrap is set.
+
+    wrap = False
 
     def __init__(self):
         self._write_pixels()
 
     def _write_pixels(self):
-        self.pixels = [([False] * SCREEN_HEIGHT) for i in range(SCREEN_WIDTH)]
-
-    def write_sprite(self, x, y, sprite_data: list):
-        logger.debug('writing sprite at x:%s y:%s with data %s', x, y, sprite_data)
-        sprite_length = len(sprite_data)
-        if sprite_length > 15:
-            sprite_length = 15
-
-        return_value = False
-        for y_delta in range(sprite_length):
-            return_value = self.write_pixel(x + 0, y + y_delta, bool(sprite_data[y_delta] & 0x80)) or return_value
-            return_value = self.write_pixel(x + 1, y + y_delta, bool(sprite_data[y_delta] & 0x40)) or return_value
-            return_value = self.write_pixel(x + 2, y + y_delta, bool(sprite_data[y_delta] & 0x20)) or return_value
-            return_value = self.write_pixel(x + 3, y + y_delta, bool(sprite_data[y_delta] & 0x10)) or return_value
-            return_value = self.write_pixel(x + 4, y + y_delta, bool(sprite_data[y_delta] & 0x08)) or return_value
-            return_value = self.write_pixel(x + 5, y + y_delta, bool(sprite_data[y_delta] & 0x04)) or return_value
-            return_value = self.write_pixel(x + 6, y + y_delta, bool(sprite_data[y_delta] & 0x02)) or return_value
-            return_value = self.write_pixel(x + 7, y + y_delta, bool(sprite_data[y_delta] & 0x01)) or return_value
-        return return_value
+        self.rows = [0] * SCREEN_HEIGHT
+
+    @property
+    def pixels(self):
+        return [[self.pixel(x, y) for y in range(SCREEN_HEIGHT)] for x in range(SCREEN_WIDTH)]
+
+    def pixel(self, x: int, y: int) -> bool:
+        return bool(self.rows[y] >> (SCREEN_WIDTH - 1 - x) & 1)
+
+    def to_bytes(self) -> bytes:
+        return b''.join(row.to_bytes(SCREEN_WIDTH // 8, 'big') for row in self.rows)
+
+    def load_bytes(self, data: bytes):
+        step = SCREEN_WIDTH // 8
+        self.rows[:] = [int.from_bytes(data[y * step:(y + 1) * step], 'big') for y in range(SCREEN_HEIGHT)]
+
+    def row_string(self, y: int) -> str:
+        return format(self.rows[y], BIT_FORMAT).translate(ROW_CHARS)
+
+    def write_sprite(self, x, y, sprite_data) -> bool:
+        x %= SCREEN_WIDTH
+        y %= SCREEN_HEIGHT
+        rows = self.rows
+        wrap = self.wrap
+        collision = 0
+        for row_data in sprite_data[:15]:
+            if y == SCREEN_HEIGHT:
+                if not wrap:
+                    break
+                y = 0
+            mask = row_data << (SCREEN_WIDTH - 8) >> x
+            if wrap:
+                mask |= (row_data << (2 * SCREEN_WIDTH - 8 - x)) & ROW_MASK
+            collision |= rows[y] & mask
+            rows[y] ^= mask
+            y += 1
+        return collision != 0
 
     def write_pixel(self, x: int, y: int, on=False) -> bool:
-        previous_pixel_value = self.pixels[x][y]
-        on = on != self.pixels[x][y]
-        self.pixels[x][y] = on
-
-        return previous_pixel_value is True and on is False
+        if not on or x >= SCREEN_WIDTH or y >= SCREEN_HEIGHT:
+            return False
+        bit = 1 << (SCREEN_WIDTH - 1 - x)
+        previous_pixel_value = self.rows[y] & bit
+        self.rows[y] ^= bit
+        return bool(previous_pixel_value)
 
     def clear(self):
         self._write_pixels()
 
 
 class Screen(VirtualScreen):
+    # Drawing only updates the rows in memory. present() then diffs them
+    # against what the terminal is showing and writes the changed runs of
+    # cells in one batch, so it should be called once per frame.
 
     def __init__(self, stdscr):
         super(Screen, self).__init__()
@@ -156,23 +192,26 @@ class Screen(VirtualScreen):
         stdscr.clear()
         curses.curs_set(0)
         self.stdscr = stdscr
-
-    def write_sprite(self, x, y, sprite_data: list) -> bool:
-        x = super(Screen, self).write_sprite(x, y, sprite_data)
-        self.refresh()
-        return x
-
-    def write_pixel(self, x: int, y: int, on=False) -> bool:
-        if x >= SCREEN_WIDTH: return
-        if y >= SCREEN_HEIGHT: return
-        return_value = super(Screen, self).write_pixel(x, y, on)
-        self.stdscr.addstr(y, x, FULL_BLOCK_CHAR if self.pixels[x][y] else EMPTY_BLOCK_CHAR)
-        return return_value
-
-    def refresh(self):
-        self.stdscr.refresh()
-
-    def clear(self):
-        self.stdscr.clear()
-        self.refresh()
-        super().clear()
+        self.doupdate = curses.doupdate
+        self.presented_rows = [0] * SCREEN_HEIGHT
+
+    def dirty_rows(self, rows=None):
+        rows = self.rows if rows is None else rows
+        return [y for y, (shown, row) in enumerate(zip(self.presented_rows, rows)) if shown != row]
+
+    def present(self, rows=None) -> bool:
+        # Shows rows, a copy of self.rows taken earlier, or self.rows itself
+        rows = self.rows if rows is None else rows
+        dirty_rows = self.dirty_rows(rows)
+        if not dirty_rows:
+            return False
+        for y in dirty_rows:
+            row = rows[y]
+            changed = format(self.presented_rows[y] ^ row, BIT_FORMAT)
+            row_string = format(row, BIT_FORMAT).translate(ROW_CHARS)
+            for run in CHANGED_RUN.finditer(changed):
+                self.stdscr.addstr(y, run.start(), row_string[run.start():run.end()])
+            self.presented_rows[y] = row
+        self.stdscr.noutrefresh()
+        self.doupdate()
+        return True
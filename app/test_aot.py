@@ -0,0 +1,118 @@
+import os
+
+import pytest
+
+from .aot import AheadOfTimeTranslator, cache_key
+from .batch import run_rom
+from .clock import CycleClock
+from .cpu import CPU
+from .keypad import VirtualKeypad
+from .screen import VirtualScreen
+
+ROM = os.path.join(os.path.dirname(__file__), '..', 'test-roms', 'display-pressed-key.ch8')
+
+# 0x200: V0 = 1, call 0x20C
+# 0x204: skip if V0 == 2
+# 0x206: jump to 0x200
+# 0x208: V1 = 7
+# 0x20A: jump to 0x20A
+# 0x20C: V0 += 1, return
+PROGRAM = [0x60, 0x01, 0x22, 0x0C, 0x30, 0x02, 0x12, 0x00, 0x61, 0x07, 0x12, 0x0A, 0x70, 0x01, 0x00, 0xEE]
+
+
+def make_cpu(program):
+    cpu = CPU(VirtualScreen(), VirtualKeypad(), clock=CycleClock())
+    cpu.load_program(program)
+    return cpu
+
+
+class TestAheadOfTimeTranslator:
+
+    def test_discovers_reachable_blocks(self, tmp_path):
+        translator = AheadOfTimeTranslator(make_cpu(PROGRAM), tmp_path)
+        assert sorted(translator.blocks) == [0x200, 0x204, 0x206, 0x208, 0x20A, 0x20C]
+
+    def test_does_not_follow_indirect_jumps(self, tmp_path):
+        # Jump to 0x204 + V0, which lands on V1 = 3
+        cpu = make_cpu([0xB2, 0x04, 0x00, 0x00, 0x61, 0x03])
+        translator = AheadOfTimeTranslator(cpu, tmp_path)
+        assert sorted(translator.blocks) == [0x200]
+        translator.run(2)
+        assert cpu.v1 == 3
+
+    def test_matches_interpreter(self, tmp_path):
+        interpreted = make_cpu(PROGRAM)
+        translated = make_cpu(PROGRAM)
+        interpreted.run(50)
+        assert AheadOfTimeTranslator(translated, tmp_path).run(50) == 50
+        assert translated.registers == interpreted.registers
+        assert translated.pc == interpreted.pc
+        assert translated.cycles == interpreted.cycles
+
+    def test_loads_from_cache(self, tmp_path):
+        first = AheadOfTimeTranslator(make_cpu(PROGRAM), tmp_path)
+        assert not first.cache_hit
+        key = cache_key(bytes(PROGRAM))
+        assert os.path.exists(os.path.join(tmp_path, key + '.marshal'))
+        assert os.path.exists(os.path.join(tmp_path, key + '.py'))
+
+        cpu = make_cpu(PROGRAM)
+        second = AheadOfTimeTranslator(cpu, tmp_path)
+        assert second.cache_hit
+        assert sorted(second.blocks) == sorted(first.blocks)
+        second.run(20)
+        assert cpu.v1 == 7
+
+    def test_other_roms_miss_the_cache(self, tmp_path):
+        AheadOfTimeTranslator(make_cpu(PROGRAM), tmp_path)
+        other = AheadOfTimeTranslator(make_cpu(PROGRAM[:-2] + [0x12, 0x0C]), tmp_path)
+        assert not other.cache_hit
+
+    def test_ignores_a_corrupt_cache(self, tmp_path):
+        path = os.path.join(tmp_path, cache_key(bytes(PROGRAM)) + '.marshal')
+        with open(path, 'wb') as f:
+            f.write(b'nonsense')
+        translator = AheadOfTimeTranslator(make_cpu(PROGRAM), tmp_path)
+        assert not translator.cache_hit
+        assert 0x200 in translator.blocks
+
+    def test_writes_fall_back_to_interpreter(self, tmp_path):
+        cpu = make_cpu([0x60, 0x01, 0x12, 0x00])
+        translator = AheadOfTimeTranslator(cpu, tmp_path)
+        cpu.memory.write(0x201, [0x07])
+        assert 0x200 not in translator.blocks
+        translator.run(2)
+        assert cpu.v0 == 7
+
+    def test_blocks_survive_a_snapshot_round_trip(self, tmp_path):
+        cpu = make_cpu(PROGRAM)
+        translator = AheadOfTimeTranslator(cpu, tmp_path)
+        blocks = dict(translator.blocks)
+        snapshot = cpu.snapshot()
+        translator.run(20)
+        cpu.restore(snapshot)
+        assert translator.blocks == blocks
+
+    def test_rebuilds_blocks_once_their_code_is_back(self, tmp_path):
+        cpu = make_cpu([0x60, 0x01, 0x12, 0x00])
+        translator = AheadOfTimeTranslator(cpu, tmp_path)
+        block = translator.blocks[0x200]
+        snapshot = cpu.snapshot()
+        cpu.memory.write(0x201, [0x07])
+        translator.run(2)
+        assert 0x200 not in translator.blocks
+
+        cpu.restore(snapshot)
+        translator.run(2)
+        assert translator.blocks[0x200] is block
+        assert cpu.v0 == 1
+
+    @pytest.mark.parametrize('cycles', (1, 199, 200))
+    def test_rom_matches_interpreter(self, cycles, monkeypatch, tmp_path):
+        monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+        events = [(100, 0x5, True)]
+        interpreted = run_rom(ROM, cycles=cycles, key_events=events, seed=1)
+        translated = run_rom(ROM, cycles=cycles, key_events=events, seed=1, engine='aot')
+        assert translated['framebuffer_sha256'] == interpreted['framebuffer_sha256']
+        assert translated['pc'] == interpreted['pc']
+        assert translated['cycles'] == interpreted['cycles']
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+from unittest.mock import MagicMock
+
+from .async_scheduler import AsyncScheduler
+
+
+class FakeTime:
+    # Time only passes when a task sleeps or a runner says so
+
+    def __init__(self):
+        self.now = 100.0
+
+    def clock(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += seconds
+        await asyncio.sleep(0)
+
+
+@pytest.fixture
+def fake_time():
+    return FakeTime()
+
+
+def make_scheduler(fake_time, run=None, frames=None, **kwargs):
+    run = run or (lambda cycles: cycles)
+    s = AsyncScheduler(MagicMock(), run, MagicMock(), MagicMock(), frame_rate=200,
+                       clock=fake_time.clock, sleep=fake_time.sleep, **kwargs)
+    if frames is not None:
+        # Frame hooks run before the frame is counted
+        s.frame_hooks.append(lambda: s.frames + 1 >= frames and s.stop())
+    return s
+
+
+class TestAsyncScheduler:
+
+    def test_runs_frames_until_stopped(self, fake_time):
+        s = make_scheduler(fake_time, frames=10, ips=2000)
+        asyncio.run(s.run_forever())
+        assert s.frames == 10
+        assert s.cycles == 100
+        assert s.cpu.tick.call_count == 10
+        assert s.present.call_count > 0
+        assert s.poll.call_count > 0
+        assert not s.running
+
+    def test_runs_frame_hooks(self, fake_time):
+        s = make_scheduler(fake_time, frames=5, ips=2000)
+        hook = MagicMock()
+        s.frame_hooks.append(hook)
+        asyncio.run(s.run_forever())
+        assert hook.call_count == s.frames == 5
+
+    def test_unlimited_ips_does_not_block_the_event_loop(self, fake_time):
+        def run(cycles):
+            fake_time.now += 0.001
+            return cycles
+        s = make_scheduler(fake_time, run, frames=3, ips=None)
+        # Only the CPU task, so all the time that passes is spent running
+        s.present = s.poll = None
+        ticks = []
+
+        async def other_task():
+            while s.running or not ticks:
+                ticks.append(None)
+                await asyncio.sleep(0)
+
+        async def main():
+            await asyncio.gather(s.run_forever(), other_task())
+        asyncio.run(main())
+        assert s.cycles == 15 * 256
+        # It got a turn between every batch
+        assert len(ticks) >= 15
+
+    def test_unlimited_ips_runs_every_frame_when_behind(self, fake_time):
+        def run(cycles):
+            fake_time.now += 0.001
+            return cycles
+        s = make_scheduler(fake_time, run, frames=10, ips=None)
+        # A terminal slower than the frame rate
+        s.present.side_effect = lambda: setattr(fake_time, 'now', fake_time.now + 2 / 200)
+        cycles = []
+        s.frame_hooks.append(lambda: cycles.append(s.cycles))
+        asyncio.run(s.run_forever())
+        assert all(b > a for a, b in zip([0] + cycles, cycles))
+
+    def test_raises_errors_from_tasks(self, fake_time):
+        def run(cycles):
+            raise NotImplementedError('No instruction for: ffff')
+        s = make_scheduler(fake_time, run, ips=2000)
+        with pytest.raises(NotImplementedError):
+            asyncio.run(s.run_forever())
+        assert not s.running
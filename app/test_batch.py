@@ -0,0 +1,66 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from .batch import run_rom, run_directory, main
+from .keypad import ScriptedKeypad
+
+ROM = os.path.join(os.path.dirname(__file__), '..', 'test-roms', 'display-pressed-key.ch8')
+
+
+class TestScriptedKeypad:
+
+    def test_applies_events_when_due(self):
+        k = ScriptedKeypad([(10, 0x5, True), (20, 0x5, False), (15, 0x2, True)])
+        k.update(9)
+        assert k.read_key() is None
+        assert k.next_event_cycle == 10
+        k.update(15)
+        assert k.read_key() == 0x2
+        assert k.is_pressed(0x5)
+        k.update(20)
+        assert not k.is_pressed(0x5)
+        assert k.next_event_cycle is None
+
+
+class TestRunRom:
+
+    @pytest.mark.parametrize('engine', ('interpreter', 'jit', 'aot'))
+    def test_reports_on_a_run(self, engine, monkeypatch, tmp_path):
+        monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+        report = run_rom(ROM, cycles=200, engine=engine, key_events=[(100, 0x5, True)])
+        assert report['exit_reason'] == 'completed'
+        assert report['cycles'] >= 200
+        assert report['errors'] == []
+
+    def test_framebuffer_hash_depends_on_input(self):
+        idle = run_rom(ROM, cycles=200)
+        pressed = run_rom(ROM, cycles=200, key_events=[(100, 0x5, True)])
+        assert idle['framebuffer_sha256'] != pressed['framebuffer_sha256']
+
+    def test_frames_are_converted_to_cycles(self):
+        assert run_rom(ROM, frames=60, ips=600)['cycles'] == 600
+
+    def test_reports_unsupported_opcodes(self, tmp_path):
+        rom = tmp_path / 'bad.ch8'
+        rom.write_bytes(bytes([0x01, 0x23]))
+        report = run_rom(str(rom), cycles=10)
+        assert report['exit_reason'] == 'unsupported_opcode'
+        assert report['errors'] == ['No instruction for: 123']
+
+
+class TestRunDirectory:
+
+    def test_runs_every_rom(self, tmp_path):
+        for name in ('a.ch8', 'b.ch8'):
+            shutil.copy(ROM, str(tmp_path / name))
+        reports = run_directory(str(tmp_path), workers=2, cycles=50)
+        assert [os.path.basename(r['rom']) for r in reports] == ['a.ch8', 'b.ch8']
+
+    def test_main_writes_json(self, tmp_path):
+        shutil.copy(ROM, str(tmp_path / 'a.ch8'))
+        output = tmp_path / 'report.json'
+        assert main([str(tmp_path), '--cycles', '50', '--workers', '1', '--output', str(output)]) == 0
+        assert json.loads(output.read_text())[0]['cycles'] == 50
@@ -0,0 +1,49 @@
+import pytest
+
+from .benchmark import representative_opcode, compare, bench_operations, bench_throughput, bench_env, _result
+
+
+def results(**values):
+    return {'results': {name: _result(value, 'ips' if name.startswith('ips') else 'ns', name.startswith('ips'))
+                        for name, value in values.items()}}
+
+
+class TestBenchmark:
+
+    @pytest.mark.parametrize(['format_str', 'opcode'], (
+            ('8XY4', 0x8124),
+            ('6XNN', 0x6110),
+            ('1NNN', 0x1300),
+            ('DXYN', 0xD125),
+            ('00EE', 0x00EE),
+    ))
+    def test_representative_opcode(self, format_str, opcode):
+        assert representative_opcode(format_str) == opcode
+
+    def test_every_operation_is_measured(self):
+        measured = bench_operations(1)
+        assert 'op.DXYN' in measured
+        assert 'op.0NNN' not in measured
+        assert all(r['value'] > 0 for r in measured.values())
+
+    def test_throughput_covers_every_engine(self, monkeypatch, tmp_path):
+        monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+        measured = bench_throughput(100)
+        assert {'ips.alu.interpreter', 'ips.alu.jit', 'ips.alu.aot', 'ips.rom.display-pressed-key.jit'} <= set(measured)
+
+    def test_env_steps_are_measured(self, monkeypatch, tmp_path):
+        pytest.importorskip('numpy')
+        monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+        measured = bench_env(5)
+        assert {'env.display-pressed-key.skip1.step', 'env.display-pressed-key.skip4.peak_bytes',
+                'env.display-pressed-key.jit.episode', 'env.display-pressed-key.aot.episode'} <= set(measured)
+        assert not any(r['higher_is_better'] for r in measured.values())
+
+    def test_compare_flags_regressions_in_either_direction(self):
+        baseline = results(**{'ips.a': 100.0, 'op.b': 100.0, 'op.c': 100.0})
+        current = results(**{'ips.a': 80.0, 'op.b': 120.0, 'op.c': 105.0, 'op.new': 1.0})
+        rows = {name: (change, regressed) for name, _, _, change, regressed in compare(current, baseline, 0.1)}
+        assert rows['ips.a'] == (pytest.approx(-0.2), True)
+        assert rows['op.b'] == (pytest.approx(-0.2), True)
+        assert rows['op.c'] == (pytest.approx(-0.05), False)
+        assert 'op.new' not in rows
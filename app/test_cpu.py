@@ -1,10 +1,9 @@
 import pytest
-from freezegun import freeze_time
-from .cpu import Register, CPU, OperationDefinition, Instruction, Memory, TimerRegister, IRegister
-from datetime import datetime, timedelta
+from .clock import WallClock, CycleClock
+from .cpu import Register, CPU, OperationDefinition, OperationTable, Instruction, Memory, TimerRegister, IRegister, SNAPSHOT_FORMAT
 from unittest.mock import MagicMock
-
-NICE_DATE = datetime(2001, 1, 1, 0, 0, 0)
+from .keypad import VirtualKeypad
+from .screen import VirtualScreen
 
 
 class TestInstruction(object):
@@ -61,9 +60,10 @@ class TestRegister(object):
 
 class TestMemory:
 
-    def test_it_isinstance_list(self):
+    def test_it_is_a_4k_bytearray(self):
         m = Memory()
-        assert isinstance(m, list)
+        assert isinstance(m, bytearray)
+        assert len(m) == 4096
 
     def test_it_has_dummy_interpreter_in_first_0x200(self):
         m = Memory()
@@ -75,6 +75,41 @@ class TestMemory:
         assert m.sprite_for_int(0xa) == 0xa * 5
         assert m.sprite_for_int(0xf) == 0xf * 5
 
+    def test_view_does_not_copy(self):
+        m = Memory()
+        view = m.view(0x200, 0x204)
+        m[0x201] = 0xab
+        assert view[1] == 0xab
+
+    def test_load_data_rejects_oversized_programs(self):
+        m = Memory()
+        with pytest.raises(IndexError):
+            m.load_data(bytes(4096 - 0x200 + 1))
+
+    @pytest.mark.parametrize('changes', ([], [0x200], [0, 0xfff], [0x23f, 0x240], [0x300, 0x301, 0x380]))
+    def test_update_writes_only_what_differs(self, changes):
+        m = Memory()
+        data = bytearray(m)
+        for address in changes:
+            data[address] ^= 0xff
+        writes = []
+        m.observers.append(lambda start, stop: writes.append((start, stop)))
+        m.update(bytes(data))
+        assert m == data
+        written = set(a for start, stop in writes for a in range(start, stop))
+        assert written == set(changes)
+
+    def test_update_rejects_the_wrong_size(self):
+        with pytest.raises(ValueError):
+            Memory().update(bytes(100))
+
+    def test_load_file(self, tmp_path):
+        rom = tmp_path / 'rom.ch8'
+        rom.write_bytes(bytes([0x60, 0x01, 0x12, 0x00]))
+        m = Memory()
+        m.load_file(str(rom))
+        assert m[0x200:0x204] == bytes([0x60, 0x01, 0x12, 0x00])
+
 
 @pytest.fixture
 def cpu():
@@ -121,6 +156,55 @@ class TestCPU:
         cpu.push_stack()
         cpu.stack == [100, 200, 300]
 
+    def test_stack_overflow(self, cpu):
+        for _ in range(16):
+            cpu.push_stack()
+        with pytest.raises(OverflowError):
+            cpu.push_stack()
+
+    def test_stack_underflow(self, cpu):
+        with pytest.raises(IndexError):
+            cpu.pop_stack()
+
+    def test_register_views_share_the_register_file(self, cpu):
+        cpu.v[3].value = 0x1ff
+        assert cpu.registers[3] == 0xff
+        cpu.registers[0xf] = 7
+        assert cpu.vf == 7
+        cpu.i.value = 0x1234
+        assert cpu.index_register == 0x234
+
+    def test_reexecutes_code_rewritten_by_fx55(self, cpu):
+        cpu.load_program([0x60, 0x01, 0x12, 0x00])  # V0 = 1, jump to 0x200
+        cpu()
+        cpu()
+        assert cpu.v0 == 1
+
+        cpu.v0.value = 0x61
+        cpu.i.value = 0x200
+        cpu(0xF055)  # Rewrite the first instruction as V1 = 1
+        cpu.pc = 0x200
+        cpu()
+        assert cpu.v1 == 1
+
+    def test_write_only_invalidates_overlapping_instructions(self, cpu):
+        cpu.load_program([0x60, 0x01, 0x61, 0x02, 0x62, 0x03])
+        for address in (0x200, 0x202, 0x204):
+            cpu.decoded_instructions.decode(address)
+        cpu.memory.write(0x203, [0x05])
+        entries = cpu.decoded_instructions.entries
+        assert entries[0x200] is not None
+        assert entries[0x202] is None
+        assert entries[0x204] is not None
+
+    def test_load_program_invalidates_decoded_instructions(self, cpu):
+        cpu.load_program([0x60, 0x01])
+        cpu()
+        cpu.load_program([0x61, 0x01])
+        cpu.pc = 0x200
+        cpu()
+        assert cpu.v1 == 1
+
     def test_pc_restored_from_stack(self, cpu):
         cpu.stack = [100, 200, 300]
         cpu.pop_stack()
@@ -414,24 +498,21 @@ class TestOpCodes():
 
     # FX15
     def test_set_delay_timer_to_vx(self, cpu):
-        with freeze_time(NICE_DATE):
-            cpu.v0.value = 0x12
-            cpu(0xf015)
-            assert cpu.delay_timer.value == 0x12
+        cpu.v0.value = 0x12
+        cpu(0xf015)
+        assert cpu.delay_timer.value == 0x12
 
     # FX15
     def test_read_delay_timer_to_vx(self, cpu):
-        with freeze_time(NICE_DATE):
-            cpu.delay_timer.value = 0x12
-            cpu(0xf007)
-            assert cpu.v0 == 0x12
+        cpu.delay_timer.value = 0x12
+        cpu(0xf007)
+        assert cpu.v0 == 0x12
 
     # FX18
     def test_set_sound_timer_to_vx(self, cpu):
-        with freeze_time(NICE_DATE):
-            cpu.v0.value = 0x12
-            cpu(0xf018)
-            assert cpu.sound_timer.value == 0x12
+        cpu.v0.value = 0x12
+        cpu(0xf018)
+        assert cpu.sound_timer.value == 0x12
 
     # ANNN
     def test_store_nnn_in_i(self, cpu):
@@ -450,10 +531,10 @@ class TestOpCodes():
         cpu.v0.value = 123
         cpu.i.value = 0x200
         cpu(0xF033)
-        assert cpu.memory[0x200:0x203] == [1, 2, 3]
+        assert list(cpu.memory[0x200:0x203]) == [1, 2, 3]
         cpu.v0.value = 9
         cpu(0xF033)
-        assert cpu.memory[0x200:0x203] == [0, 0, 9]
+        assert list(cpu.memory[0x200:0x203]) == [0, 0, 9]
 
     # FX55
     def test_v0_to_vx_to_memory(self, cpu):
@@ -464,7 +545,7 @@ class TestOpCodes():
 
         cpu(0xF455)
 
-        assert cpu.memory[0x200:0x20F] == [0, 1, 2, 3, 4, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
+        assert list(cpu.memory[0x200:0x20F]) == [0, 1, 2, 3, 4, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
         assert cpu.i.value == 0x205
 
     # FX65
@@ -488,7 +569,9 @@ class TestOpCodes():
         cpu.memory[0x202] = 3
         cpu.memory[0x203] = 4
         cpu(0xD014)
-        cpu.screen.write_sprite.assert_called_once_with(10, 20, [1, 2, 3, 4])
+        cpu.screen.write_sprite.assert_called_once()
+        x, y, sprite_data = cpu.screen.write_sprite.call_args[0]
+        assert (x, y, list(sprite_data)) == (10, 20, [1, 2, 3, 4])
 
     # DXYN
     def test_draw_sprite_sets_vf_if_write_sprite_returns_true(self, cpu):
@@ -531,28 +614,28 @@ class TestOpCodes():
 
     # EX9E
     def test_skip_if_vx_eq_key_pressed__values_equal(self, cpu):
-        cpu.keypad.read_key.return_value = 0xf
+        cpu.keypad.is_pressed.side_effect = lambda key: key == 0xf
         cpu.v0.value = 0xf
         cpu(0xE09E)
         assert cpu.pc == 0x204
 
     # EX9E
     def test_skip_if_vx_eq_key_pressed__values_not_equal(self, cpu):
-        cpu.keypad.read_key.return_value = 0xf
+        cpu.keypad.is_pressed.side_effect = lambda key: key == 0xf
         cpu.v0.value = 0
         cpu(0xE09E)
         assert cpu.pc == 0x202
 
     # EXA1
     def test_skip_if_vx_neq_key_pressed__values_equal(self, cpu):
-        cpu.keypad.read_key.return_value = 0xf
+        cpu.keypad.is_pressed.side_effect = lambda key: key == 0xf
         cpu.v0.value = 0xf
         cpu(0xE0A1)
         assert cpu.pc == 0x202
 
     # EXA1
     def test_skip_if_vx_neq_key_pressed__values_not_equal(self, cpu):
-        cpu.keypad.read_key.return_value = 0xf
+        cpu.keypad.is_pressed.side_effect = lambda key: key == 0xf
         cpu.v0.value = 0
         cpu(0xE0A1)
         assert cpu.pc == 0x204
@@ -576,10 +659,117 @@ class TestOpcodeDefinitionMapper:
         assert x.responds_to(opcode) is responds
 
 
+class TestSnapshot:
+
+    def make_cpu(self):
+        cpu = CPU(VirtualScreen(), VirtualKeypad(), clock=CycleClock(ips=600))
+        cpu.load_program([0x60, 0x07, 0xF0, 0x29, 0xD0, 0x05, 0x22, 0x00])
+        return cpu
+
+    def test_round_trip(self):
+        cpu = self.make_cpu()
+        cpu.run(4)
+        cpu.delay_timer.value = 30
+        cpu.keypad.press(0xa)
+        snapshot = cpu.snapshot()
+
+        other = self.make_cpu()
+        other.restore(snapshot)
+        assert other.snapshot() == snapshot
+        assert other.pc == 0x200
+        assert other.stack == [0x206]
+        assert other.v0 == 7
+        assert other.delay_timer.value == 30
+        assert other.keypad.is_pressed(0xa)
+        assert other.screen.rows == cpu.screen.rows
+
+    def test_restore_rewinds_execution(self):
+        cpu = self.make_cpu()
+        snapshot = cpu.snapshot()
+        cpu.run(3)
+        cpu.restore(snapshot)
+        assert cpu.cycles == 0
+        assert cpu.v0 == 0
+        assert not any(cpu.screen.rows)
+        cpu.run(3)
+        assert cpu.v0 == 7
+
+    def test_restore_drops_decoded_instructions(self):
+        cpu = self.make_cpu()
+        snapshot = cpu.snapshot()
+        cpu.memory.write(0x200, [0x61, 0x01])
+        cpu.run(1)
+        cpu.restore(snapshot)
+        cpu.run(1)
+        assert cpu.v0 == 7
+
+    def test_restore_keeps_unchanged_instructions_decoded(self):
+        cpu = self.make_cpu()
+        snapshot = cpu.snapshot()
+        cpu.run(3)
+        entry = cpu.decoded_instructions.entries[0x200]
+        cpu.restore(snapshot)
+        assert cpu.decoded_instructions.entries[0x200] is entry
+
+    def test_snapshot_is_a_few_kb(self):
+        assert len(self.make_cpu().snapshot()) < 5000
+
+    @pytest.mark.parametrize('snapshot', (b'', b'nope' * 2000))
+    def test_rejects_garbage(self, snapshot):
+        with pytest.raises(ValueError):
+            self.make_cpu().restore(snapshot)
+
+    @pytest.mark.parametrize(['field', 'value'], (('version', 99), ('sp', 17), ('sp', 255)))
+    def test_rejects_bad_fields(self, field, value):
+        fields = list(SNAPSHOT_FORMAT.unpack(self.make_cpu().snapshot()))
+        fields[{'version': 1, 'sp': 4}[field]] = value
+        cpu = self.make_cpu()
+        with pytest.raises(ValueError):
+            cpu.restore(SNAPSHOT_FORMAT.pack(*fields))
+        assert cpu.sp == 0
+
+    def test_accepts_a_full_stack(self):
+        cpu = self.make_cpu()
+        cpu.stack = list(range(0x300, 0x320, 2))
+        other = self.make_cpu()
+        other.restore(cpu.snapshot())
+        assert other.sp == cpu.stack_size
+
+
+class TestOperationTable:
+
+    def test_agrees_with_linear_scan_for_every_opcode(self, cpu):
+        for opcode in range(0x10000):
+            expected = next((d for d in cpu.supported_operations if d.responds_to(opcode)), None)
+            assert cpu.operations.lookup(opcode) is expected
+
+    def test_more_specific_definition_wins(self):
+        general = OperationDefinition('0NNN', lambda inst: None)
+        specific = OperationDefinition('00E0', lambda inst: None)
+        table = OperationTable((general, specific), None)
+        assert table.lookup(0x00E0) is specific
+        assert table.lookup(0x00E1) is general
+
+    def test_unmatched_opcodes_use_fallback(self):
+        fallback = MagicMock()
+        table = OperationTable((OperationDefinition('1NNN', lambda inst: None),), fallback)
+        assert table.lookup(0x2000) is None
+        assert table[0x2000] is fallback
+
+    @pytest.mark.parametrize(['a', 'b'], (
+            ('8XY0', '8XY0'),
+            ('8X1N', '8XN1'),
+            ('1NN0', '1N0N'),
+    ))
+    def test_rejects_ambiguous_definitions(self, a, b):
+        with pytest.raises(ValueError):
+            OperationTable((OperationDefinition(a, None), OperationDefinition(b, None)), None)
+
+
 class TestTimerRegister:
 
     @pytest.mark.parametrize(['initial_value', 'delta', 'expected'], (
-            #One per second
+            #One per tick
             (10, 0, 10),
             (10, 1, 9),
             (10, 2, 8),
@@ -596,9 +786,26 @@ class TestTimerRegister:
             (10, 1000000, 0),
             (0, 1000000, 0),
     ))
-    def test_it_decrements_value_once_per_second(self, initial_value, delta, expected):
-        t = TimerRegister()
-        with freeze_time(NICE_DATE):
-            t.value = initial_value
-        with freeze_time(NICE_DATE + timedelta(seconds=delta)):
-            assert t.value == expected
\ No newline at end of file
+    def test_it_decrements_value_once_per_tick(self, initial_value, delta, expected):
+        clock = WallClock()
+        t = TimerRegister(clock)
+        t.value = initial_value
+        clock.ticks += delta
+        assert t.value == expected
+
+    def test_unset_timer_reads_0(self):
+        assert TimerRegister().value == 0
+
+    def test_cycle_clock_ticks_with_executed_instructions(self):
+        cpu = CPU(MagicMock(), MagicMock(), clock=CycleClock(ips=600))
+        cpu.load_program([0x12, 0x00])
+        cpu.delay_timer.value = 3
+        cpu.run(10)
+        assert cpu.delay_timer.value == 2
+        cpu.run(20)
+        assert cpu.delay_timer.value == 0
+
+    def test_cpu_tick_advances_wall_clock(self, cpu):
+        cpu.delay_timer.value = 3
+        cpu.tick()
+        assert cpu.delay_timer.value == 2
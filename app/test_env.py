@@ -0,0 +1,96 @@
+import hashlib
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from .env import Chip8Env
+from .batch import run_rom
+
+ROM = os.path.join(os.path.dirname(__file__), '..', 'test-roms', 'display-pressed-key.ch8')
+
+
+class TestChip8Env:
+
+    def test_observation_is_a_zero_copy_view(self):
+        env = Chip8Env(ROM)
+        observation = env.reset(seed=0)
+        assert not observation.flags.writeable
+        assert observation.shape == (32, 64)
+        stepped, _, _, _ = env.step(0x5)
+        assert stepped is observation
+        assert np.shares_memory(observation, env.screen.frame)
+
+    def test_step_runs_whole_frames(self):
+        env = Chip8Env(ROM, ips=600)
+        env.reset()
+        _, reward, done, info = env.step(None, frame_skip=3)
+        assert (reward, done) == (0.0, False)
+        assert info['frames'] == 3
+        assert info['cycles'] == 30
+
+    def test_matches_batch_runner(self):
+        env = Chip8Env(ROM, ips=600)
+        env.reset(seed=1)
+        env.step(0x5, frame_skip=20)
+        report = run_rom(ROM, cycles=200, ips=600, key_events=[(0, 0x5, True)], seed=1)
+        assert hashlib.sha256(env.screen.to_bytes()).hexdigest() == report['framebuffer_sha256']
+
+    def test_reset_restores_the_initial_state(self):
+        env = Chip8Env(ROM)
+        first = env.reset(seed=3).copy()
+        env.step(0x5, frame_skip=10)
+        assert not np.array_equal(env.observation, first)
+        assert np.array_equal(env.reset(seed=3), first)
+        assert env.cpu.cycles == 0
+
+    def test_same_seed_and_actions_reproduce(self):
+        env = Chip8Env(ROM)
+        runs = []
+        for _ in range(2):
+            env.reset(seed=7)
+            for action in (1, None, 0xa, 0xa, 3):
+                env.step(action, frame_skip=2)
+            runs.append(env.observation.copy())
+        assert np.array_equal(*runs)
+
+    @pytest.mark.parametrize('engine', ('jit', 'aot'))
+    def test_translated_blocks_survive_reset(self, engine, monkeypatch, tmp_path):
+        monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+        env = Chip8Env(ROM, engine=engine)
+        interpreted = Chip8Env(ROM)
+        blocks = env.run.__self__.blocks
+        for _ in range(3):
+            for e in (env, interpreted):
+                e.reset(seed=2)
+                e.step(0x5, frame_skip=5)
+            translated = dict(blocks)
+            assert translated
+            assert np.array_equal(env.observation, interpreted.observation)
+            assert env.cpu.snapshot() == interpreted.cpu.snapshot()
+        env.reset(seed=2)
+        assert blocks == translated
+
+    def test_faults_end_the_episode(self):
+        env = Chip8Env([0xFF, 0xFF])
+        env.reset()
+        _, _, done, info = env.step()
+        assert done
+        assert info['error'].startswith('NotImplementedError')
+        with pytest.raises(RuntimeError):
+            env.step()
+
+    def test_reward(self):
+        env = Chip8Env(ROM, reward=lambda env: float(env.observation.sum()))
+        env.reset()
+        _, reward, _, _ = env.step(0x5, frame_skip=10)
+        assert reward == env.observation.sum() > 0
+
+    def test_render(self):
+        env = Chip8Env(ROM)
+        env.reset()
+        env.step(0x5, frame_skip=10)
+        lines = env.render().split('\n')
+        assert len(lines) == 32
+        assert all(len(line) == 64 for line in lines)
@@ -0,0 +1,92 @@
+import pytest
+from unittest.mock import MagicMock
+
+from .clock import CycleClock, WallClock
+from .cpu import CPU
+from .idle import IdleSkipper
+from .jit import BlockTranslator
+from .keypad import VirtualKeypad
+from .scheduler import Scheduler
+from .screen import VirtualScreen
+
+# V0 = 30; delay = V0; wait for the delay timer; V1 = 1; wait for a key; jump to self
+TIMER_THEN_KEY = [0x60, 0x1E, 0xF0, 0x15, 0xF2, 0x07, 0x32, 0x00, 0x12, 0x04, 0x61, 0x01, 0xF3, 0x0A, 0x12, 0x0E]
+
+
+def make_cpu(program, clock=None):
+    cpu = CPU(VirtualScreen(), VirtualKeypad(), clock or CycleClock(ips=600))
+    cpu.load_program(program)
+    return cpu
+
+
+class TestIdleSkipper:
+
+    @pytest.mark.parametrize('cycles', (1, 5, 100, 301, 302, 303, 304, 305, 1000))
+    def test_matches_running_every_cycle(self, cycles):
+        expected = make_cpu(TIMER_THEN_KEY)
+        expected.run(cycles)
+        actual = make_cpu(TIMER_THEN_KEY)
+        skipper = IdleSkipper(actual)
+        assert skipper(cycles) == cycles
+        assert actual.snapshot() == expected.snapshot()
+
+    def test_matches_in_small_batches(self):
+        expected = make_cpu(TIMER_THEN_KEY)
+        actual = make_cpu(TIMER_THEN_KEY)
+        skipper = IdleSkipper(actual, BlockTranslator(actual).run)
+        for batch in (7, 1, 2, 50, 3, 100, 200, 13):
+            expected.run(batch)
+            skipper(batch)
+            assert actual.snapshot() == expected.snapshot()
+
+    def test_skips_the_timer_loop(self):
+        cpu = make_cpu(TIMER_THEN_KEY)
+        run = MagicMock(side_effect=cpu.run)
+        skipper = IdleSkipper(cpu, run)
+        skipper(1000)
+        assert skipper.skipped_cycles > 850
+        assert sum(call.args[0] for call in run.call_args_list) < 100
+        assert cpu.v1.value == 1
+        assert skipper.idle
+
+    def test_waits_for_a_key(self):
+        cpu = make_cpu([0xF3, 0x0A, 0x12, 0x02])
+        skipper = IdleSkipper(cpu)
+        assert skipper(500) == 500
+        assert (cpu.pc, cpu.cycles, skipper.idle) == (0x200, 500, True)
+        cpu.keypad.press(0x7)
+        skipper(1)
+        assert (cpu.pc, cpu.v3.value, skipper.idle) == (0x202, 7, False)
+
+    def test_wall_clock_timer_loop_is_idle_for_the_batch(self):
+        cpu = make_cpu(TIMER_THEN_KEY, WallClock())
+        skipper = IdleSkipper(cpu)
+        skipper(500)
+        assert cpu.pc in (0x204, 0x206, 0x208)
+        assert cpu.v2.value == 30
+        assert skipper.idle
+        assert skipper.skipped_cycles >= 400
+
+    def test_busy_code_is_not_skipped(self):
+        cpu = make_cpu([0x70, 0x01, 0x12, 0x00])
+        skipper = IdleSkipper(cpu)
+        skipper(100)
+        assert skipper.skipped_cycles == 0
+        assert cpu.v0.value == 50
+        assert not skipper.idle
+
+
+class TestSchedulerIdleSkipping:
+
+    def test_unlimited_ips_sleeps_when_idle(self):
+        now = [0.0]
+        slept = []
+        def sleep(seconds):
+            slept.append(seconds)
+            now[0] += seconds
+        cpu = make_cpu([0x12, 0x00], WallClock())
+        s = Scheduler(cpu, ips=None, clock=lambda: now[0], sleep=sleep, skip_idle=True)
+        s.run_frame()
+        s.run_frame()
+        assert s.cycles == 2 * 256
+        assert slept == [pytest.approx(1 / 60)] * 2
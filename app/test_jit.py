@@ -0,0 +1,105 @@
+import random
+
+import pytest
+from unittest.mock import MagicMock
+
+from .clock import CycleClock, WallClock
+from .cpu import CPU
+from .jit import BlockTranslator, STRAIGHT_LINE_OPERATIONS
+
+
+def make_cpu(program, clock=None):
+    cpu = CPU(MagicMock(), MagicMock(), clock)
+    cpu.load_program(program)
+    return cpu
+
+
+def random_straight_line_program(rng, length):
+    formats = [f for f in STRAIGHT_LINE_OPERATIONS if f != 'CXNN']
+    program = []
+    for _ in range(length):
+        opcode = int(''.join(c if c in '0123456789ABCDEF' else '{:X}'.format(rng.randrange(16))
+                             for c in rng.choice(formats)), 16)
+        program += [opcode >> 8, opcode & 0xff]
+    return program
+
+
+class TestBlockTranslator:
+
+    @pytest.mark.parametrize('clock', [WallClock, lambda: CycleClock(ips=60)])
+    @pytest.mark.parametrize('seed', range(20))
+    def test_matches_interpreter(self, seed, clock):
+        rng = random.Random(seed)
+        program = random_straight_line_program(rng, 40) + [0x12, 0x00]
+        interpreted = make_cpu(program, clock())
+        translated = make_cpu(program, clock())
+        registers = [rng.randrange(256) for _ in range(16)]
+        for cpu in (interpreted, translated):
+            for r, value in zip(cpu.v, registers):
+                r.value = value
+            cpu.i.value = 0x300
+
+        interpreted.run(41)
+        BlockTranslator(translated).run(41)
+
+        assert [r.value for r in translated.v] == [r.value for r in interpreted.v]
+        assert translated.i.value == interpreted.i.value
+        assert translated.pc == interpreted.pc == 0x200
+        assert translated.cycles == interpreted.cycles
+        assert translated.delay_timer.target_tick == interpreted.delay_timer.target_tick
+        assert translated.sound_timer.target_tick == interpreted.sound_timer.target_tick
+
+    def test_timers_see_the_cycle_count_mid_block(self):
+        # V0 = 10; V1 = 0; delay = V0; V2 = 0; V3 = 0; V1 = delay; loop
+        program = [0x60, 0x0A, 0x61, 0x00, 0xF0, 0x15, 0x62, 0x00, 0x63, 0x00, 0xF1, 0x07, 0x12, 0x0C]
+        interpreted = make_cpu(program, CycleClock(ips=60))
+        translated = make_cpu(program, CycleClock(ips=60))
+        interpreted.run(7)
+        BlockTranslator(translated).run(7)
+
+        for cpu in (interpreted, translated):
+            assert (cpu.v1, cpu.delay_timer.target_tick, cpu.cycles) == (7, 12, 7)
+
+    def test_block_ends_at_control_flow(self):
+        cpu = make_cpu([0x60, 0x01, 0x70, 0x02, 0x12, 0x00])
+        block = BlockTranslator(cpu).translate(0x200)
+        assert block.length == 3
+        assert block.stop == 0x206
+
+    def test_terminator_runs_through_interpreter(self):
+        cpu = make_cpu([0x60, 0x05, 0x30, 0x05, 0x61, 0x01, 0x62, 0x01])
+        BlockTranslator(cpu).run(2)
+        assert cpu.pc == 0x206
+
+    def test_writes_invalidate_blocks(self):
+        cpu = make_cpu([0x60, 0x01, 0x12, 0x00])
+        translator = BlockTranslator(cpu)
+        translator.run(2)
+        assert 0x200 in translator.blocks
+
+        cpu.memory.write(0x201, [0x07])
+        assert 0x200 not in translator.blocks
+        translator.run(2)
+        assert cpu.v0 == 7
+
+    def test_self_modifying_code(self):
+        # V0 = 0x61; I = 0x200; dump V0 over the first byte; jump back
+        cpu = make_cpu([0x60, 0x61, 0xA2, 0x00, 0xF0, 0x55, 0x12, 0x00])
+        translator = BlockTranslator(cpu)
+        translator.run(4)
+        translator.run(1)
+        assert cpu.v1 == 0x61
+
+    def test_fault_leaves_interpreter_state(self):
+        # V1 = 5; I = 0xfff; V2 = 9; load V0-V3 from past the end of memory
+        program = [0x61, 0x05, 0xAF, 0xFF, 0x62, 0x09, 0xF3, 0x65]
+        interpreted = make_cpu(program)
+        translated = make_cpu(program)
+        with pytest.raises(IndexError) as interpreted_error:
+            interpreted.run(4)
+        with pytest.raises(IndexError) as translated_error:
+            BlockTranslator(translated).run(4)
+
+        assert str(translated_error.value) == str(interpreted_error.value)
+        for cpu in (interpreted, translated):
+            assert (cpu.pc, cpu.cycles, cpu.i.value, cpu.v1, cpu.v2) == (0x206, 3, 0xfff, 5, 9)
@@ -0,0 +1,79 @@
+import curses
+import os
+import subprocess
+import sys
+
+from unittest.mock import MagicMock
+
+from .keypad import Keypad
+
+
+def make_keypad(keys, hold_frames=3):
+    # keys is a list of the keys typed before each poll
+    stdscr = MagicMock()
+    frames = [list(frame) for frame in keys]
+    def getkey():
+        if not frames or not frames[0]:
+            if frames:
+                frames.pop(0)
+            raise curses.error('no input')
+        return frames[0].pop(0)
+    stdscr.getkey.side_effect = getkey
+    return Keypad(stdscr, hold_frames)
+
+
+class TestKeypad:
+
+    def test_poll_maps_keys(self):
+        k = make_keypad([['w']])
+        assert k.read_key() is None
+        k.poll()
+        assert k.read_key() == 0x5
+        assert k.is_pressed(0x5)
+
+    def test_holds_several_keys(self):
+        k = make_keypad([['w', 'x', 'v']])
+        k.poll()
+        assert k.held == 1 << 0x5 | 1 << 0x0 | 1 << 0xf
+        assert k.read_key() == 0x0
+
+    def test_releases_after_timeout(self):
+        k = make_keypad([['w'], [], []])
+        k.poll()
+        k.poll()
+        k.poll()
+        assert k.is_pressed(0x5)
+        k.poll()
+        assert not k.is_pressed(0x5)
+
+    def test_repeats_keep_keys_held(self):
+        k = make_keypad([['w'], [], ['w'], [], []])
+        for _ in range(5):
+            k.poll()
+        assert k.is_pressed(0x5)
+
+    def test_poll_runs_hotkeys(self):
+        k = make_keypad([['w', 'b', 'x']])
+        k.hotkeys['b'] = MagicMock()
+        k.poll()
+        k.hotkeys['b'].assert_called_once_with()
+        assert k.held == 1 << 0x5 | 1 << 0x0
+
+    def test_ignores_unmapped_keys(self):
+        k = make_keypad([['p']])
+        k.poll()
+        assert k.held == 0
+
+    def test_reads_no_input_between_polls(self):
+        k = make_keypad([['w']])
+        k.poll()
+        calls = k.stdscr.getkey.call_count
+        for _ in range(100):
+            k.read_key()
+            k.is_pressed(0x5)
+        assert k.stdscr.getkey.call_count == calls
+
+    def test_headless_modules_do_not_need_curses(self):
+        code = "import sys; sys.modules['curses'] = None; import app.batch, app.replay, app.benchmark"
+        root = os.path.join(os.path.dirname(__file__), '..')
+        subprocess.run([sys.executable, '-c', code], cwd=root, check=True)
@@ -0,0 +1,53 @@
+import random
+
+import pytest
+from unittest.mock import MagicMock
+
+np = pytest.importorskip('numpy')
+
+from .cpu import CPU
+from .numpy_screen import NumpyScreen
+from .screen import VirtualScreen, SCREEN_WIDTH, SCREEN_HEIGHT
+
+
+class TestNumpyScreen:
+
+    @pytest.mark.parametrize('wrap', (False, True))
+    def test_matches_virtual_screen(self, wrap):
+        rng = random.Random(wrap)
+        expected, actual = VirtualScreen(), NumpyScreen()
+        expected.wrap = actual.wrap = wrap
+        for _ in range(500):
+            x, y = rng.randrange(256), rng.randrange(256)
+            sprite = bytes(rng.randrange(256) for _ in range(rng.randrange(1, 16)))
+            assert actual.write_sprite(x, y, memoryview(sprite)) is expected.write_sprite(x, y, sprite)
+        assert actual.rows == expected.rows
+
+    def test_frame_view_is_zero_copy_and_read_only(self):
+        s = NumpyScreen()
+        view = s.frame_view()
+        assert view.shape == (SCREEN_HEIGHT, SCREEN_WIDTH)
+        s.write_sprite(3, 4, [0x80])
+        assert view[4, 3] == 1
+        s.clear()
+        assert not view.any()
+        with pytest.raises(ValueError):
+            view[0, 0] = 1
+
+    def test_frame_view_as_bool(self):
+        s = NumpyScreen()
+        s.write_sprite(0, 0, [0x80])
+        assert s.frame_view(np.bool_)[0, 0] is np.True_
+
+    def test_works_with_cpu(self):
+        cpu = CPU(NumpyScreen(), MagicMock())
+        cpu.v0.value = 0
+        cpu(0xF029)  # I = font sprite for 0
+        cpu(0xD005)
+        assert cpu.vf == 0
+        assert cpu.screen.frame[0, :4].tolist() == [1, 1, 1, 1]
+        cpu(0xD005)
+        assert cpu.vf == 1
+        assert not cpu.screen.frame.any()
+        cpu(0x00E0)
+        assert not cpu.screen.frame.any()
@@ -0,0 +1,62 @@
+import pytest
+
+from .clock import CycleClock
+from .cpu import CPU
+from .keypad import VirtualKeypad
+from .profiler import Profiler
+from .screen import VirtualScreen
+
+
+@pytest.fixture
+def cpu():
+    cpu = CPU(VirtualScreen(), VirtualKeypad(), clock=CycleClock())
+    # Add 1 to V0 and jump back, forever
+    cpu.load_program([0x70, 0x01, 0x12, 0x00])
+    return cpu
+
+
+class TestProfiler:
+
+    def test_counts_operations(self, cpu):
+        with Profiler(cpu) as profiler:
+            cpu.run(100)
+        counts = {row['operation']: row['count'] for row in profiler.operation_stats()}
+        assert counts == {'7XNN': 50, '1NNN': 50}
+
+    def test_hot_addresses(self, cpu):
+        with Profiler(cpu) as profiler:
+            cpu.run(101)
+        assert profiler.hot_addresses() == [(0x200, 51), (0x202, 50)]
+        assert profiler.hot_addresses(limit=1) == [(0x200, 51)]
+
+    def test_stop_restores_handlers(self, cpu):
+        handlers = list(cpu.operations.handlers)
+        profiler = Profiler(cpu)
+        with profiler:
+            assert profiler.running
+            cpu.run(10)
+        assert not profiler.running
+        assert cpu.operations.handlers == handlers
+        cpu.run(10)
+        assert sum(profiler.counts) == 10
+
+    def test_cached_instructions_are_profiled(self, cpu):
+        cpu.run(10)
+        with Profiler(cpu) as profiler:
+            cpu.run(10)
+        assert sum(profiler.counts) == 10
+
+    def test_unsupported_operation(self, cpu):
+        cpu.load_program([0xFF, 0xFF])
+        with Profiler(cpu) as profiler:
+            with pytest.raises(NotImplementedError):
+                cpu.step()
+        assert [row['operation'] for row in profiler.operation_stats()] == ['????']
+
+    def test_report(self, cpu):
+        with Profiler(cpu) as profiler:
+            cpu.run(100)
+        report = profiler.report()
+        assert report.startswith('100 instructions')
+        assert '7XNN' in report and '1NNN' in report
+        assert '0x200' in report and '0x202' in report
@@ -0,0 +1,73 @@
+import threading
+import time
+
+from unittest.mock import MagicMock
+
+from .renderer import ThreadedRenderer
+from .screen import SCREEN_HEIGHT
+
+
+class FakeScreen:
+
+    def __init__(self, delay=0.0):
+        self.rows = [0] * SCREEN_HEIGHT
+        self.delay = delay
+        self.presented = []
+        self.presenting = threading.Event()
+
+    def present(self, rows=None):
+        self.presenting.set()
+        time.sleep(self.delay)
+        self.presented.append(list(rows))
+        return True
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+class TestThreadedRenderer:
+
+    def test_presents_the_swapped_frame(self):
+        screen = FakeScreen()
+        with ThreadedRenderer(screen) as renderer:
+            screen.rows[0] = 1
+            renderer.swap()
+            screen.rows[0] = 2
+            wait_for(lambda: renderer.presented_frames == 1)
+        assert screen.presented[0][0] == 1
+
+    def test_slow_presents_do_not_block_swaps(self):
+        screen = FakeScreen(delay=0.2)
+        with ThreadedRenderer(screen) as renderer:
+            started = time.monotonic()
+            for frame in range(10):
+                screen.rows[0] = frame
+                renderer.swap()
+            assert time.monotonic() - started < 0.1
+            wait_for(lambda: screen.presented and screen.presented[-1][0] == 9)
+        # Frames swapped while presenting are dropped, not queued
+        assert len(screen.presented) < 10
+
+    def test_try_locked_skips_while_presenting(self):
+        screen = FakeScreen(delay=0.2)
+        poll = MagicMock()
+        with ThreadedRenderer(screen) as renderer:
+            locked_poll = renderer.try_locked(poll)
+            renderer.swap()
+            screen.presenting.wait(1)
+            locked_poll()
+            poll.assert_not_called()
+            wait_for(lambda: renderer.presented_frames == 1)
+            locked_poll()
+            poll.assert_called_once_with()
+
+    def test_stop_joins_the_thread(self):
+        renderer = ThreadedRenderer(FakeScreen())
+        renderer.start()
+        thread = renderer._thread
+        renderer.stop()
+        assert not thread.is_alive()
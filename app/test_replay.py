@@ -0,0 +1,84 @@
+import pytest
+from unittest.mock import MagicMock
+
+from .clock import CycleClock
+from .cpu import CPU
+from .keypad import VirtualKeypad
+from .replay import Recording, RecordingKeypad, replay, main
+from .screen import VirtualScreen
+
+# Waits for a key, draws its font digit at a random position, repeats
+PROGRAM = bytes([0xF0, 0x0A, 0xF0, 0x29, 0xC1, 0x3F, 0xC2, 0x1F, 0xD1, 0x25, 0x12, 0x00])
+
+
+@pytest.fixture
+def rom(tmp_path):
+    path = tmp_path / 'rom.ch8'
+    path.write_bytes(PROGRAM)
+    return str(path)
+
+
+def record_session(rom, presses, seed=1234, ips=600):
+    # presses maps a cycle to the key the user is holding from then on
+    source = VirtualKeypad()
+    keypad = RecordingKeypad(source, lambda: cpu.cycles)
+    cpu = CPU(VirtualScreen(), keypad, CycleClock(ips))
+    cpu.seed(seed)
+    cpu.load_program_file(rom)
+    for cycle in range(2000):
+        if cycle in presses:
+            source.held = 0 if presses[cycle] is None else 1 << presses[cycle]
+        keypad.poll()
+        cpu.run(1)
+    return Recording.finish(cpu, keypad, rom, seed, ips)
+
+
+class TestRecordingKeypad:
+
+    def test_logs_changes_with_cycle(self):
+        source = VirtualKeypad()
+        cycles = iter(range(100))
+        keypad = RecordingKeypad(source, lambda: next(cycles))
+        for held in (0, 1 << 5, 1 << 5, 1 << 5 | 1 << 7, 1 << 7, 0):
+            source.held = held
+            keypad.poll()
+        assert keypad.events == [(0, 5, True), (1, 7, True), (2, 5, False), (3, 7, False)]
+
+    def test_polls_the_wrapped_keypad(self):
+        source = MagicMock(held=0)
+        RecordingKeypad(source, int).poll()
+        source.poll.assert_called_once_with()
+
+    def test_passes_other_attributes_through(self):
+        source = MagicMock(held=0)
+        assert RecordingKeypad(source, int).is_pressed is source.is_pressed
+
+
+class TestReplay:
+
+    def test_reproduces_the_recorded_run(self, rom, tmp_path):
+        recording = record_session(rom, {100: 3, 400: None, 900: 0xa, 1500: 1})
+        path = str(tmp_path / 'session.json')
+        recording.save(path)
+
+        report = replay(Recording.load(path), rom)
+        assert report['exit_reason'] == 'completed'
+        assert report['cycles'] == recording.cycles
+        assert report['matches_recording']
+
+    def test_detects_divergence(self, rom):
+        recording = record_session(rom, {100: 3})
+        recording.seed += 1
+        assert not replay(recording, rom)['matches_recording']
+
+    def test_rejects_other_roms(self, rom, tmp_path):
+        recording = record_session(rom, {})
+        other = tmp_path / 'other.ch8'
+        other.write_bytes(PROGRAM + b'\x00')
+        with pytest.raises(ValueError):
+            replay(recording, str(other))
+
+    def test_main(self, rom, tmp_path):
+        path = str(tmp_path / 'session.json')
+        record_session(rom, {100: 3}).save(path)
+        assert main([path, rom, '--engine', 'jit']) == 0
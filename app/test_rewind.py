@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+from .clock import CycleClock
+from .cpu import CPU
+from .keypad import VirtualKeypad
+from .rewind import Rewind, rle_encode, rle_decode, xor_bytes
+from .screen import VirtualScreen
+
+
+@pytest.fixture
+def cpu():
+    cpu = CPU(VirtualScreen(), VirtualKeypad(), clock=CycleClock(ips=600))
+    # Count V0 up forever, drawing the font digit for it each time round
+    cpu.load_program([0x70, 0x01, 0xF0, 0x29, 0xD1, 0x15, 0x12, 0x00])
+    return cpu
+
+
+class TestRunLengthEncoding:
+
+    @pytest.mark.parametrize('data', (
+            b'',
+            bytes(100),
+            b'\x01\x02\x00\x00\x03',
+            bytes(70000) + b'\x01',
+            b'\xff' * 70000,
+    ))
+    def test_round_trip(self, data):
+        assert rle_decode(rle_encode(data), len(data)) == data
+
+    def test_round_trip_random(self):
+        rng = random.Random(0)
+        data = bytes(rng.choice((0, 0, 0, rng.randrange(256))) for _ in range(5000))
+        assert rle_decode(rle_encode(data), len(data)) == data
+
+    def test_mostly_zero_data_is_small(self):
+        data = bytearray(4096)
+        data[100] = 1
+        assert len(rle_encode(bytes(data))) < 10
+
+    def test_xor(self):
+        assert xor_bytes(b'\x0f\xf0', b'\xff\xff') == b'\xf0\x0f'
+
+
+class TestRewind:
+
+    def run_frames(self, cpu, rewind, frames):
+        for _ in range(frames):
+            cpu.run(10)
+            rewind.frame()
+
+    def test_steps_back_one_capture_at_a_time(self, cpu):
+        rewind = Rewind(cpu, interval=2)
+        snapshots = []
+        for _ in range(5):
+            self.run_frames(cpu, rewind, 2)
+            snapshots.append(cpu.snapshot())
+        self.run_frames(cpu, rewind, 1)
+
+        for expected in reversed(snapshots[:-1]):
+            assert rewind.rewind()
+            assert cpu.snapshot() == expected
+        assert rewind.rewind()
+        assert cpu.snapshot() == snapshots[0]
+
+    def test_nothing_to_rewind_to(self, cpu):
+        assert Rewind(cpu).rewind() is False
+
+    def test_history_is_bounded(self, cpu):
+        rewind = Rewind(cpu, interval=1, capacity=50)
+        self.run_frames(cpu, rewind, 500)
+        assert len(rewind) == 51
+        assert rewind.memory_usage() < 51 * len(cpu.snapshot())
+
+    def test_execution_continues_after_rewinding(self, cpu):
+        rewind = Rewind(cpu, interval=1)
+        self.run_frames(cpu, rewind, 3)
+        rewind.rewind()
+        cycles = cpu.cycles
+        self.run_frames(cpu, rewind, 1)
+        assert cpu.cycles == cycles + 10
@@ -0,0 +1,94 @@
+import pytest
+from unittest.mock import MagicMock
+
+from .scheduler import Scheduler, MAX_LAG
+
+
+class FakeTime:
+
+    def __init__(self):
+        self.now = 100.0
+        self.slept = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def fake_time():
+    return FakeTime()
+
+
+def make_scheduler(fake_time, run=None, **kwargs):
+    cpu = MagicMock()
+    run = run or (lambda cycles: cycles)
+    return Scheduler(cpu, run, MagicMock(), clock=fake_time.clock, sleep=fake_time.sleep, **kwargs)
+
+
+class TestScheduler:
+
+    def test_runs_ips_worth_of_cycles_per_second(self, fake_time):
+        s = make_scheduler(fake_time, ips=700)
+        for _ in range(60):
+            s.run_frame()
+        assert s.cycles == 700
+        assert s.cpu.tick.call_count == 60
+        assert s.present.call_count == 60
+
+    def test_sleeps_the_rest_of_the_frame(self, fake_time):
+        def run(cycles):
+            fake_time.now += 0.004
+            return cycles
+        s = make_scheduler(fake_time, run, ips=600)
+        s.run_frame()
+        assert fake_time.slept == [pytest.approx(1 / 60 - 0.004)]
+        assert s.lag == 0
+
+    def test_carries_overshoot_into_next_frame(self, fake_time):
+        s = make_scheduler(fake_time, lambda cycles: cycles + 5, ips=600)
+        s.run_frame()
+        s.run_frame()
+        assert s.cycles == 15 + 10
+
+    def test_reports_lag(self, fake_time):
+        def run(cycles):
+            fake_time.now += 0.02
+            return cycles
+        s = make_scheduler(fake_time, run, ips=600)
+        s.run_frame()
+        assert s.lag == pytest.approx(0.02 - 1 / 60)
+        assert fake_time.slept == []
+
+    def test_skips_ahead_when_too_far_behind(self, fake_time):
+        def run(cycles):
+            fake_time.now += MAX_LAG + 1
+            return cycles
+        s = make_scheduler(fake_time, run, ips=600)
+        s.run_frame()
+        assert s.dropped_frames > 0
+        assert s._next_frame == fake_time.now
+
+    def test_unlimited_ips_fills_the_frame(self, fake_time):
+        def run(cycles):
+            fake_time.now += 0.001
+            return cycles
+        s = make_scheduler(fake_time, run, ips=None)
+        s.run_frame()
+        assert s.cycles == 17 * 256
+        assert s.present.call_count == 1
+
+    def test_unlimited_ips_runs_every_frame_when_behind(self, fake_time):
+        def run(cycles):
+            fake_time.now += 0.001
+            return cycles
+        s = make_scheduler(fake_time, run, ips=None)
+        # A terminal slower than the frame rate
+        s.present.side_effect = lambda: setattr(fake_time, 'now', fake_time.now + 2 / 60)
+        for _ in range(10):
+            before = s.cycles
+            s.run_frame()
+            assert s.cycles > before
@@ -0,0 +1,140 @@
+import random
+
+import curses
+
+import pytest
+from unittest.mock import MagicMock, call
+
+from .screen import Screen, VirtualScreen, SCREEN_WIDTH, SCREEN_HEIGHT
+
+
+def reference_write_sprite(pixels, x, y, sprite_data, wrap):
+    collision = False
+    for y_delta, row_data in enumerate(sprite_data[:15]):
+        for x_delta in range(8):
+            if not row_data & (0x80 >> x_delta):
+                continue
+            px = x % SCREEN_WIDTH + x_delta
+            py = y % SCREEN_HEIGHT + y_delta
+            if wrap:
+                px %= SCREEN_WIDTH
+                py %= SCREEN_HEIGHT
+            elif px >= SCREEN_WIDTH or py >= SCREEN_HEIGHT:
+                continue
+            collision = collision or pixels[px][py]
+            pixels[px][py] = not pixels[px][py]
+    return collision
+
+
+class TestVirtualScreen:
+
+    def test_draws_sprite_rows(self):
+        s = VirtualScreen()
+        assert s.write_sprite(0, 0, [0x80, 0x01]) is False
+        assert s.pixel(0, 0)
+        assert not s.pixel(1, 0)
+        assert s.pixel(7, 1)
+
+    def test_detects_collision_and_xors(self):
+        s = VirtualScreen()
+        s.write_sprite(10, 5, [0xff])
+        assert s.write_sprite(10, 5, [0x10]) is True
+        assert not s.pixel(13, 5)
+        assert s.pixel(12, 5)
+
+    def test_clips_at_right_and_bottom_edges(self):
+        s = VirtualScreen()
+        s.write_sprite(60, 30, [0xff, 0xff, 0xff])
+        assert s.pixel(63, 31)
+        assert not s.pixel(0, 30)
+        assert s.rows[0] == 0
+
+    def test_start_coordinates_wrap(self):
+        s = VirtualScreen()
+        s.write_sprite(SCREEN_WIDTH + 1, SCREEN_HEIGHT + 2, [0x80])
+        assert s.pixel(1, 2)
+
+    def test_wraps_when_enabled(self):
+        s = VirtualScreen()
+        s.wrap = True
+        s.write_sprite(62, 31, [0xf0, 0xf0])
+        assert s.pixel(63, 31) and s.pixel(0, 31) and s.pixel(1, 31)
+        assert s.pixel(0, 0)
+
+    def test_clear(self):
+        s = VirtualScreen()
+        s.write_sprite(0, 0, [0xff])
+        s.clear()
+        assert s.rows == [0] * SCREEN_HEIGHT
+
+    def test_row_string(self):
+        s = VirtualScreen()
+        s.write_sprite(0, 0, [0xa0])
+        assert s.row_string(0).startswith('█ █ ')
+
+    @pytest.mark.parametrize('wrap', (False, True))
+    def test_matches_pixel_by_pixel_reference(self, wrap):
+        rng = random.Random(wrap)
+        s = VirtualScreen()
+        s.wrap = wrap
+        pixels = [[False] * SCREEN_HEIGHT for _ in range(SCREEN_WIDTH)]
+        for _ in range(500):
+            x, y = rng.randrange(256), rng.randrange(256)
+            sprite = bytes(rng.randrange(256) for _ in range(rng.randrange(1, 16)))
+            expected = reference_write_sprite(pixels, x, y, sprite, wrap)
+            assert s.write_sprite(x, y, sprite) is expected
+        assert s.pixels == pixels
+
+
+@pytest.fixture
+def screen(monkeypatch):
+    monkeypatch.setattr(curses, 'LINES', SCREEN_HEIGHT, raising=False)
+    monkeypatch.setattr(curses, 'COLS', SCREEN_WIDTH, raising=False)
+    monkeypatch.setattr(curses, 'curs_set', MagicMock())
+    monkeypatch.setattr(curses, 'doupdate', MagicMock())
+    s = Screen(MagicMock())
+    s.stdscr.reset_mock()
+    return s
+
+
+class TestScreen:
+
+    def test_drawing_does_not_touch_the_terminal(self, screen):
+        screen.write_sprite(0, 0, [0xff])
+        screen.clear()
+        assert screen.stdscr.method_calls == []
+
+    def test_present_writes_changed_runs_once_per_frame(self, screen):
+        screen.write_sprite(0, 0, [0xc0])
+        screen.write_sprite(4, 0, [0x80, 0x80])
+        assert screen.present() is True
+        assert screen.stdscr.addstr.call_args_list == [
+            call(0, 0, '██'),
+            call(0, 4, '█'),
+            call(1, 4, '█'),
+        ]
+        screen.stdscr.noutrefresh.assert_called_once()
+        screen.doupdate.assert_called_once()
+
+    def test_present_skips_unchanged_frames(self, screen):
+        screen.write_sprite(0, 0, [0xff])
+        screen.present()
+        screen.stdscr.reset_mock()
+        assert screen.present() is False
+        assert screen.stdscr.method_calls == []
+
+    def test_present_erases_cleared_cells(self, screen):
+        screen.write_sprite(8, 2, [0x81])
+        screen.present()
+        screen.stdscr.reset_mock()
+        screen.clear()
+        screen.present()
+        assert screen.stdscr.addstr.call_args_list == [call(2, 8, ' '), call(2, 15, ' ')]
+
+    def test_present_given_rows(self, screen):
+        rows = [0] * SCREEN_HEIGHT
+        rows[3] = 1 << (SCREEN_WIDTH - 1)
+        screen.write_sprite(0, 0, [0xff])
+        assert screen.present(rows) is True
+        assert screen.stdscr.addstr.call_args_list == [call(3, 0, '█')]
+        assert screen.presented_rows == rows
@@ -0,0 +1,102 @@
+import pytest
+
+from .clock import CycleClock
+from .cpu import CPU
+from .keypad import VirtualKeypad
+from .screen import VirtualScreen
+from .trace import RECORD, Tracer, TraceRecord, read_trace, first_divergence, main
+
+
+def make_cpu(program):
+    cpu = CPU(VirtualScreen(), VirtualKeypad(), clock=CycleClock())
+    cpu.seed(0)
+    cpu.load_program(program)
+    return cpu
+
+
+# Set V0 to 10, call a subroutine that adds 1 to it and stores its BCD at
+# 0x300, then loop
+PROGRAM = [0x60, 0x0A, 0x22, 0x06, 0x12, 0x02, 0x70, 0x01, 0xA3, 0x00, 0xF0, 0x33, 0x00, 0xEE]
+
+
+@pytest.fixture
+def cpu():
+    return make_cpu(PROGRAM)
+
+
+def trace(cpu, path, cycles):
+    with Tracer(cpu, path):
+        cpu.run(cycles)
+    return list(read_trace(path))
+
+
+class TestTracer:
+
+    @pytest.mark.parametrize('name', ('run.trace', 'run.jsonl'))
+    def test_records_every_instruction(self, cpu, tmp_path, name):
+        records = trace(cpu, tmp_path / name, 6)
+        assert [r.cycle for r in records] == [0, 1, 2, 3, 4, 5]
+        assert [r.pc for r in records] == [0x200, 0x202, 0x206, 0x208, 0x20A, 0x20C]
+        assert records[0].opcode == 0x600A
+        assert records[0].changed == 0b1
+        assert records[0].v[0] == 10
+        assert records[1].changed == 0
+        assert records[1].sp == 1
+        assert records[2].v[0] == 11
+        assert records[3].i == 0x300
+        assert (records[4].write_address, records[4].write_data) == (0x300, b'\x00\x01\x01')
+        assert records[3].write_data == b''
+        assert records[5].sp == 0
+
+    def test_binary_records_are_fixed_size(self, cpu, tmp_path):
+        path = tmp_path / 'run.trace'
+        trace(cpu, path, 100)
+        assert (path.stat().st_size - 6) == 100 * RECORD.size
+
+    def test_reads_more_than_one_batch(self, cpu, tmp_path):
+        assert len(trace(cpu, tmp_path / 'run.trace', 10000)) == 10000
+
+    def test_records_the_failing_instruction(self, tmp_path):
+        cpu = make_cpu([0xFF, 0xFF])
+        path = tmp_path / 'run.trace'
+        with Tracer(cpu, path):
+            with pytest.raises(NotImplementedError):
+                cpu.step()
+        assert [r.opcode for r in read_trace(path)] == [0xFFFF]
+
+    def test_stop_restores_handlers(self, cpu, tmp_path):
+        handlers = list(cpu.operations.handlers)
+        tracer = Tracer(cpu, tmp_path / 'run.trace')
+        with tracer:
+            assert tracer.running
+            cpu.run(2)
+        assert not tracer.running
+        assert cpu.operations.handlers == handlers
+        assert tracer._memory_written not in cpu.memory.observers
+        cpu.run(2)
+        assert tracer.records == 2
+
+
+class TestDiff:
+
+    def test_identical(self, tmp_path, capsys):
+        trace(make_cpu(PROGRAM), tmp_path / 'a.trace', 500)
+        trace(make_cpu(PROGRAM), tmp_path / 'b.jsonl', 500)
+        assert main([str(tmp_path / 'a.trace'), str(tmp_path / 'b.jsonl')]) == 0
+        assert 'identical' in capsys.readouterr().out
+
+    def test_reports_first_divergent_cycle(self, tmp_path, capsys):
+        changed = list(PROGRAM)
+        changed[7] = 0x02
+        trace(make_cpu(PROGRAM), tmp_path / 'a.trace', 500)
+        trace(make_cpu(changed), tmp_path / 'b.trace', 500)
+        assert main([str(tmp_path / 'a.trace'), str(tmp_path / 'b.trace')]) == 1
+        out = capsys.readouterr().out
+        assert 'record 2' in out
+        assert 'cycle 2 pc 0x206 opcode 7001' in out
+        assert 'cycle 2 pc 0x206 opcode 7002' in out
+
+    def test_shorter_trace(self):
+        record = TraceRecord(0, 0x200, 0x600A, 1, bytes(16), 0, 0, 0, b'')
+        assert first_divergence([record], [record, record]) == (1, None, record)
+        assert first_divergence([record], [record]) is None
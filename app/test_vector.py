@@ -0,0 +1,150 @@
+import os
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from .clock import CycleClock
+from .cpu import CPU
+from .keypad import VirtualKeypad
+from .screen import VirtualScreen
+from .vector import VectorCPU
+
+ROM = os.path.join(os.path.dirname(__file__), '..', 'test-roms', 'display-pressed-key.ch8')
+IPS = 600
+
+
+def random_program(rng, length):
+    # Jumps, calls and ANNN mostly stay inside the program, so it runs for a
+    # while before anything faults
+    formats = [d.str for d in make_cpu(b'').supported_operations]
+    program = []
+    for _ in range(length):
+        format_str = rng.choice(formats)
+        opcode = int(''.join(c if c in '0123456789ABCDEF' else '{:X}'.format(rng.randrange(16))
+                             for c in format_str), 16)
+        if format_str in ('1NNN', '2NNN', 'BNNN', 'ANNN'):
+            opcode = (opcode & 0xf000) | (0x200 + 2 * rng.randrange(length))
+        program += [opcode >> 8, opcode & 0xff]
+    return bytes(program)
+
+
+def make_cpu(program, held=0, seed=0, registers=None):
+    keypad = VirtualKeypad()
+    keypad.held = held
+    cpu = CPU(VirtualScreen(), keypad, CycleClock(IPS))
+    cpu.seed(seed)
+    cpu.load_program(program)
+    if registers is not None:
+        cpu.registers[:] = bytes(registers)
+    return cpu
+
+
+def run_scalar(cpu, cycles):
+    # Returns the exception the CPU stopped on, if any
+    for _ in range(cycles):
+        try:
+            cpu.step()
+        except Exception as e:
+            return e
+    return None
+
+
+class TestVectorCPU:
+
+    @pytest.mark.parametrize('seed', range(10))
+    def test_matches_scalar_cpu(self, seed):
+        rng = random.Random(seed)
+        program = random_program(rng, 100)
+        count = 32
+        held = [rng.choice((0, 1 << rng.randrange(16), rng.randrange(1 << 16))) for _ in range(count)]
+        registers = [[rng.randrange(256) for _ in range(16)] for _ in range(count)]
+
+        machines = VectorCPU(count, ips=IPS)
+        machines.load_program(program)
+        machines.seed(range(count))
+        machines.held[:] = held
+        machines.registers[:] = registers
+        machines.run(300)
+
+        for k in range(count):
+            cpu = make_cpu(program, held[k], k, registers[k])
+            error = run_scalar(cpu, 300)
+            assert machines.faulted[k] == (error is not None)
+            if error is not None:
+                assert machines.errors[k].startswith(type(error).__name__)
+            assert machines.snapshot(k) == cpu.snapshot()
+
+    def test_8xy7_writes_vy(self):
+        machines = VectorCPU(1)
+        machines.load_program([0x60, 0x05, 0x61, 0x03, 0x80, 0x17])
+        machines.run(3)
+        assert machines.registers[0, :2].tolist() == [5, 2]
+
+    def test_rom_with_different_keys(self):
+        machines = VectorCPU(16, ips=IPS)
+        machines.load_program_file(ROM)
+        machines.held[:] = [1 << key for key in range(16)]
+        machines.run(500)
+        for key in range(16):
+            cpu = CPU(VirtualScreen(), VirtualKeypad(), CycleClock(IPS))
+            cpu.load_program_file(ROM)
+            cpu.keypad.press(key)
+            cpu.run(500)
+            assert machines.screen_bytes(key) == cpu.screen.to_bytes()
+        assert len(set(machines.screen_bytes(k) for k in range(16))) == 16
+
+    def test_faulted_instances_stop(self):
+        machines = VectorCPU(2)
+        machines.load_program([0x30, 0x01, 0xFF, 0xFF, 0x12, 0x04])
+        machines.registers[1, 0] = 1
+        machines.run(10)
+        assert machines.faulted.tolist() == [True, False]
+        assert machines.cycles.tolist() == [1, 10]
+        assert machines.pc[0] == 0x202
+
+    def test_seed_checks_the_count_first(self):
+        machines = VectorCPU(2)
+        randoms = machines.randoms
+        with pytest.raises(ValueError):
+            machines.seed(range(3))
+        assert machines.randoms is randoms
+        # CXNN with a 0xff mask
+        machines.load_program([0xC0, 0xFF])
+        machines.run(1)
+        assert not machines.faulted.any()
+
+    def test_restore_from_scalar_snapshot(self):
+        cpu = make_cpu(open(ROM, 'rb').read())
+        cpu.keypad.press(0x3)
+        cpu.run(200)
+        machines = VectorCPU(4, ips=IPS)
+        machines.restore(cpu.snapshot())
+        assert all(machines.snapshot(k) == cpu.snapshot() for k in range(4))
+        machines.run(100)
+        cpu.run(100)
+        assert machines.snapshot(3) == cpu.snapshot()
+
+    def test_frames(self):
+        machines = VectorCPU(2)
+        # Draw the font digit 0 at 0, 0
+        machines.load_program([0xD0, 0x05])
+        machines.run(1)
+        screen = VirtualScreen()
+        screen.write_sprite(0, 0, [0xF0, 0x90, 0x90, 0x90, 0xF0])
+        frames = machines.frames()
+        assert frames.shape == (2, 32, 64)
+        assert frames[1].tolist() == [[int(p) for p in format(row, '064b')] for row in screen.rows]
+
+    @pytest.mark.parametrize('wrap', (False, True))
+    def test_sprites_clip_or_wrap_like_the_screen(self, wrap):
+        # Draw digit 8 at 60, 30
+        program = [0x60, 0x3C, 0x61, 0x1E, 0x62, 0x08, 0xF2, 0x29, 0xD0, 0x15]
+        machines = VectorCPU(1, wrap=wrap)
+        machines.load_program(program)
+        machines.run(5)
+        cpu = make_cpu(bytes(program))
+        cpu.screen.wrap = wrap
+        cpu.run(5)
+        assert machines.screen_bytes(0) == cpu.screen.to_bytes()
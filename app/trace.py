@@ -0,0 +1,232 @@
+# Writes a record of every instruction the CPU executes, for debugging, and
+# compares two such traces.
+#
+#     with Tracer(cpu, 'run.trace'):
+#         cpu.run(1000000)
+#
+#     python -m app.trace before.trace after.trace
+#
+# Traces are binary by default: a short header and then one fixed-size
+# record per instruction holding the cycle, the address and opcode executed,
+# which V registers it changed, the registers it left behind and the bytes
+# it wrote to memory. Paths ending in .jsonl get one JSON object per line
+# instead, which is bigger and slower but readable.
+#
+# Like the Profiler, a Tracer only swaps its wrappers into the CPU's
+# OperationTable while tracing, so the untraced path does no extra work.
+# Blocks compiled by the translator never go through the table and are not
+# traced.
+
+import argparse
+import json
+import struct
+import sys
+from collections import namedtuple
+from itertools import zip_longest
+
+BUFFER_SIZE = 1 << 16
+# Records read from a binary trace at a time
+READ_BATCH = 4096
+
+TRACE_MAGIC = b'C8TR'
+TRACE_VERSION = 1
+HEADER = struct.Struct('<4sH')
+# cycle, pc, opcode, changed register mask, V0-VF, I, sp, write address,
+# write length, written bytes. No instruction writes more than 16 bytes.
+RECORD = struct.Struct('<QHHH16sHBHB16s')
+MAX_WRITE = 16
+
+TraceRecord = namedtuple('TraceRecord', 'cycle pc opcode changed v i sp write_address write_data')
+
+
+def changed_registers(before: bytes, after: bytes) -> int:
+    mask = 0
+    for n, (a, b) in enumerate(zip(before, after)):
+        if a != b:
+            mask |= 1 << n
+    return mask
+
+
+class BinaryTraceWriter:
+
+    def __init__(self, path, buffer_size=BUFFER_SIZE):
+        self.file = open(path, 'wb', buffering=buffer_size)
+        self.file.write(HEADER.pack(TRACE_MAGIC, TRACE_VERSION))
+
+    def write(self, record: TraceRecord, name: str):
+        self.file.write(RECORD.pack(record.cycle, record.pc, record.opcode, record.changed, record.v, record.i,
+                                    record.sp, record.write_address, len(record.write_data), record.write_data))
+
+    def close(self):
+        self.file.close()
+
+
+class JsonTraceWriter:
+
+    def __init__(self, path, buffer_size=BUFFER_SIZE):
+        self.file = open(path, 'w', buffering=buffer_size)
+        self.encode = json.JSONEncoder(separators=(',', ':')).encode
+
+    def write(self, record: TraceRecord, name: str):
+        fields = record._asdict()
+        fields['op'] = name
+        fields['v'] = list(record.v)
+        fields['write_data'] = record.write_data.hex()
+        self.file.write(self.encode(fields))
+        self.file.write('\n')
+
+    def close(self):
+        self.file.close()
+
+
+def writer_for(path, buffer_size=BUFFER_SIZE):
+    if str(path).endswith('.jsonl'):
+        return JsonTraceWriter(path, buffer_size)
+    return BinaryTraceWriter(path, buffer_size)
+
+
+class Tracer:
+
+    def __init__(self, cpu, path, buffer_size=BUFFER_SIZE):
+        self.cpu = cpu
+        self.path = path
+        self.buffer_size = buffer_size
+        self.records = 0
+        self._writer = None
+        self._write_range = None
+        self._original_handlers = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def running(self):
+        return self._original_handlers is not None
+
+    def start(self):
+        if self.running:
+            return
+        self._writer = writer_for(self.path, self.buffer_size)
+        self.cpu.memory.observers.append(self._memory_written)
+        handlers = self.cpu.operations.handlers
+        self._original_handlers = list(handlers)
+        handlers[:] = [self._wrap(i, handler) for i, handler in enumerate(handlers)]
+        self.cpu.decoded_instructions.clear()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.cpu.operations.handlers[:] = self._original_handlers
+        self._original_handlers = None
+        self.cpu.decoded_instructions.clear()
+        self.cpu.memory.observers.remove(self._memory_written)
+        self._writer.close()
+        self._writer = None
+
+    def _memory_written(self, start, stop):
+        self._write_range = (start, stop)
+
+    def _wrap(self, slot, handler):
+        cpu = self.cpu
+        definitions = cpu.operations.definitions
+        name = definitions[slot].str if slot < len(definitions) else '????'
+        write = self._writer.write
+
+        def traced(inst):
+            pc = cpu.pc
+            before = bytes(cpu.registers)
+            self._write_range = None
+            try:
+                handler(inst)
+            finally:
+                # Written even when the handler raises, so the trace ends
+                # with the instruction that failed
+                after = bytes(cpu.registers)
+                write_address, write_data = 0, b''
+                if self._write_range is not None:
+                    start, stop = self._write_range
+                    write_address, write_data = start, bytes(cpu.memory[start:min(stop, start + MAX_WRITE)])
+                write(TraceRecord(cpu.cycles, pc, inst.data, changed_registers(before, after), after,
+                                  cpu.index_register, cpu.sp, write_address, write_data), name)
+                self.records += 1
+        return traced
+
+
+def _read_binary(f):
+    magic, version = HEADER.unpack(f.read(HEADER.size))
+    if version != TRACE_VERSION:
+        raise ValueError('Unsupported trace version {}'.format(version))
+    while True:
+        chunk = f.read(RECORD.size * READ_BATCH)
+        if len(chunk) % RECORD.size:
+            raise ValueError('Truncated trace')
+        for cycle, pc, opcode, changed, v, i, sp, write_address, write_length, write_data in RECORD.iter_unpack(chunk):
+            yield TraceRecord(cycle, pc, opcode, changed, v, i, sp, write_address, write_data[:write_length])
+        if len(chunk) < RECORD.size * READ_BATCH:
+            return
+
+
+def _read_json(f):
+    for line in f:
+        fields = json.loads(line)
+        del fields['op']
+        fields['v'] = bytes(fields['v'])
+        fields['write_data'] = bytes.fromhex(fields['write_data'])
+        yield TraceRecord(**fields)
+
+
+def read_trace(path):
+    # Yields a TraceRecord per instruction, whichever format the trace is in
+    with open(path, 'rb') as f:
+        binary = f.read(len(TRACE_MAGIC)) == TRACE_MAGIC
+        f.seek(0)
+        if binary:
+            yield from _read_binary(f)
+        else:
+            yield from _read_json(f)
+
+
+def first_divergence(a, b):
+    # Returns (index, record from a, record from b) for the first records
+    # that differ, with None for a trace that ended first, or None if the
+    # traces are identical
+    for index, (record_a, record_b) in enumerate(zip_longest(a, b)):
+        if record_a != record_b:
+            return index, record_a, record_b
+    return None
+
+
+def describe(record):
+    if record is None:
+        return 'end of trace'
+    return 'cycle {} pc {:#05x} opcode {:04X}'.format(record.cycle, record.pc, record.opcode)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Reports where two instruction traces first differ.')
+    parser.add_argument('a', help='A trace written by app.trace.Tracer')
+    parser.add_argument('b', help='The trace to compare it with')
+    args = parser.parse_args(argv)
+
+    divergence = first_divergence(read_trace(args.a), read_trace(args.b))
+    if divergence is None:
+        print('Traces are identical')
+        return 0
+
+    index, record_a, record_b = divergence
+    print('Traces diverge at record {}'.format(index))
+    print('  {}: {}'.format(args.a, describe(record_a)))
+    print('  {}: {}'.format(args.b, describe(record_b)))
+    if record_a is not None and record_b is not None:
+        for field, value_a, value_b in zip(TraceRecord._fields, record_a, record_b):
+            if value_a != value_b:
+                print('  {}: {!r} != {!r}'.format(field, value_a, value_b))
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,410 @@
+# Runs many copies of a CHIP-8 machine in lockstep, with their state held in
+# NumPy arrays. Requires numpy, which is not a dependency of the emulator
+# itself.
+#
+#     machines = VectorCPU(1024)
+#     machines.load_program_file('rom.ch8')
+#     machines.seed(range(1024))
+#     machines.held[:] = key_bitmaps
+#     machines.run(10000)
+#
+# Every step fetches each machine's opcode, groups the machines by the
+# operation it decodes to through the scalar CPU's OperationTable, and runs
+# one array operation per group. Handlers share their names with the CPU's,
+# and each instance behaves exactly like a CPU with a CycleClock, a
+# VirtualScreen and a VirtualKeypad - quirks included.
+#
+# Where the CPU would raise, the instance is marked as faulted instead and
+# stops; the others carry on.
+
+import random
+
+import numpy as np
+
+from .clock import CycleClock, DEFAULT_IPS
+from .cpu import CPU, Memory, SNAPSHOT_FORMAT, SNAPSHOT_MAGIC, SNAPSHOT_VERSION
+from .keypad import VirtualKeypad
+from .screen import VirtualScreen, FRAME_RATE, SCREEN_WIDTH, SCREEN_HEIGHT
+
+_SHIFT_TO_TOP = np.uint64(SCREEN_WIDTH - 8)
+# Index of the lowest held key for every keypad bitmap
+_LOWEST_KEY = np.array([(held & -held).bit_length() - 1 for held in range(1 << 16)], dtype=np.int64)
+
+
+class VectorCPU:
+
+    def __init__(self, count, ips=DEFAULT_IPS, frame_rate=FRAME_RATE, wrap=False):
+        self.count = count
+        self.ips = ips
+        self.frame_rate = frame_rate
+        self.wrap = wrap
+
+        # Only used for its operation table
+        template = CPU(VirtualScreen(), VirtualKeypad(), CycleClock(ips, frame_rate))
+        self.stack_size = template.stack_size
+        self.definitions = template.operations.definitions
+        self.index = np.frombuffer(template.operations.index, dtype=np.uint8)
+        self.handlers = [getattr(self, d.cb.__name__) for d in self.definitions] + [self.unsupported_operation]
+
+        self.registers = np.zeros((count, 16), dtype=np.uint8)
+        self.index_register = np.zeros(count, dtype=np.int64)
+        self.pc = np.full(count, Memory.program_start, dtype=np.int64)
+        self.sp = np.zeros(count, dtype=np.int64)
+        self.call_stack = np.zeros((count, self.stack_size), dtype=np.int64)
+        self.cycles = np.zeros(count, dtype=np.int64)
+        self.memory = np.tile(np.frombuffer(bytes(Memory()), dtype=np.uint8), (count, 1))
+        self.delay_target = np.zeros(count, dtype=np.int64)
+        self.sound_target = np.zeros(count, dtype=np.int64)
+        # One packed row per int, leftmost pixel in the top bit, like VirtualScreen.rows
+        self.rows = np.zeros((count, SCREEN_HEIGHT), dtype=np.uint64)
+        # Keypad bitmaps, bit N being key N
+        self.held = np.zeros(count, dtype=np.int64)
+        self.randoms = [random.Random() for _ in range(count)]
+
+        self.faulted = np.zeros(count, dtype=bool)
+        self.errors = {}
+        self._active = np.arange(count)
+
+    def seed(self, seeds):
+        randoms = [random.Random(seed) for seed in seeds]
+        if len(randoms) != self.count:
+            raise ValueError('Expected {} seeds, got {}'.format(self.count, len(randoms)))
+        self.randoms = randoms
+
+    def load_program(self, program):
+        program = np.frombuffer(bytes(program), dtype=np.uint8)
+        self.memory[:, Memory.program_start:Memory.program_start + len(program)] = program
+
+    def load_program_file(self, path):
+        with open(path, 'rb') as f:
+            self.load_program(f.read())
+
+    def restore(self, snapshot: bytes, instances=slice(None)):
+        # Loads a CPU.snapshot() into the given instances, all by default
+        if len(snapshot) != SNAPSHOT_FORMAT.size or snapshot[:4] != SNAPSHOT_MAGIC:
+            raise ValueError('Not a CHIP-8 snapshot')
+        fields = SNAPSHOT_FORMAT.unpack(snapshot)
+        if fields[1] != SNAPSHOT_VERSION:
+            raise ValueError('Unsupported snapshot version: {}'.format(fields[1]))
+        if fields[4] > self.stack_size:
+            raise ValueError('Snapshot stack pointer {} is out of range'.format(fields[4]))
+        pc, index_register, sp, cycles, delay, sound, held, registers = fields[2:10]
+        self.pc[instances] = pc
+        self.index_register[instances] = index_register
+        self.sp[instances] = sp
+        self.cycles[instances] = cycles
+        ticks = cycles * self.frame_rate // self.ips
+        self.delay_target[instances] = ticks + delay
+        self.sound_target[instances] = ticks + sound
+        self.held[instances] = held
+        self.registers[instances] = np.frombuffer(registers, dtype=np.uint8)
+        self.call_stack[instances] = fields[10:10 + self.stack_size]
+        self.memory[instances] = np.frombuffer(fields[-2], dtype=np.uint8)
+        self.rows[instances] = np.frombuffer(fields[-1], dtype='>u8')
+        self.faulted[instances] = False
+        self.errors = {k: e for k, e in self.errors.items() if not self.faulted[k]}
+        self._active = np.flatnonzero(~self.faulted)
+
+    def snapshot(self, k: int) -> bytes:
+        # Instance k as a CPU.snapshot(), for restoring into a scalar CPU
+        ticks = int(self._ticks(k))
+        return SNAPSHOT_FORMAT.pack(
+            SNAPSHOT_MAGIC, SNAPSHOT_VERSION, int(self.pc[k]), int(self.index_register[k]), int(self.sp[k]),
+            int(self.cycles[k]), max(0, int(self.delay_target[k]) - ticks), max(0, int(self.sound_target[k]) - ticks),
+            int(self.held[k]), self.registers[k].tobytes(), *self.call_stack[k].tolist(),
+            self.memory[k].tobytes(), self.screen_bytes(k))
+
+    def screen_bytes(self, k: int) -> bytes:
+        # The same bytes as VirtualScreen.to_bytes() for instance k
+        return self.rows[k].astype('>u8').tobytes()
+
+    def frames(self) -> np.ndarray:
+        # (count, SCREEN_HEIGHT, SCREEN_WIDTH) array of 0s and 1s
+        return np.unpackbits(self.rows.astype('>u8').view(np.uint8).reshape(self.count, SCREEN_HEIGHT, -1), axis=2)
+
+    ###################################################################
+
+    def step(self):
+        active = self._active
+        if not len(active):
+            return
+        pc = self.pc[active]
+        out_of_bounds = pc > self.memory.shape[1] - 2
+        if out_of_bounds.any():
+            self._fault(active[out_of_bounds], 'IndexError: PC out of bounds')
+            active = self._active
+            if not len(active):
+                return
+            pc = self.pc[active]
+
+        memory = self.memory
+        opcodes = (memory[active, pc].astype(np.int64) << 8) | memory[active, pc + 1]
+        slots = self.index[opcodes]
+        first = slots[0]
+        if (slots == first).all():
+            self.handlers[first](active, opcodes)
+        else:
+            order = np.argsort(slots, kind='stable')
+            groups = np.split(order, np.flatnonzero(np.diff(slots[order])) + 1)
+            for group in groups:
+                self.handlers[slots[group[0]]](active[group], opcodes[group])
+        self.cycles[active] += ~self.faulted[active]
+
+    def run(self, cycles):
+        for _ in range(cycles):
+            self.step()
+        return cycles
+
+    def _fault(self, sel, message):
+        self.faulted[sel] = True
+        for k in sel.tolist():
+            self.errors[k] = message
+        self._active = np.flatnonzero(~self.faulted)
+
+    def _ticks(self, sel):
+        return self.cycles[sel] * self.frame_rate // self.ips
+
+    def _skip_when(self, sel, condition):
+        self.pc[sel] += np.where(condition, 4, 2)
+
+    ###################################################################
+    # Handlers, named after the CPU's. Each gets the instances in a group
+    # and their opcodes.
+
+    def unsupported_operation(self, sel, op):
+        for k, data in zip(sel.tolist(), op.tolist()):
+            self._fault(np.array([k]), 'NotImplementedError: No instruction for: {0:x}'.format(data))
+
+    def store_nn_in_vx(self, sel, op):
+        self.registers[sel, op >> 8 & 0xf] = op & 0xff
+        self.pc[sel] += 2
+
+    def store_vy_in_vx(self, sel, op):
+        v = self.registers
+        v[sel, op >> 8 & 0xf] = v[sel, op >> 4 & 0xf]
+        self.pc[sel] += 2
+
+    def add_nn_to_vx(self, sel, op):
+        v = self.registers
+        x = op >> 8 & 0xf
+        v[sel, x] = (v[sel, x].astype(np.int64) + (op & 0xff)) & 0xff
+        self.pc[sel] += 2
+
+    def add_vy_to_vx(self, sel, op):
+        v = self.registers
+        x, y = op >> 8 & 0xf, op >> 4 & 0xf
+        vx_pre_op = v[sel, x].astype(np.int64)
+        result = (vx_pre_op + v[sel, y]) & 0xff
+        v[sel, x] = result
+        v[sel, 0xf] = result < vx_pre_op
+        self.pc[sel] += 2
+
+    def subtract_vy_from_vx(self, sel, op):
+        v = self.registers
+        x, y = op >> 8 & 0xf, op >> 4 & 0xf
+        vx_pre_op = v[sel, x].astype(np.int64)
+        result = (vx_pre_op - v[sel, y]) & 0xff
+        v[sel, x] = result
+        v[sel, 0xf] = result > vx_pre_op
+        self.pc[sel] += 2
+
+    def store_vy_sub_vx_in_vx(self, sel, op):
+        # Writes VY, as CPU.store_vy_sub_vx_in_vx does
+        v = self.registers
+        x, y = op >> 8 & 0xf, op >> 4 & 0xf
+        vy_pre_op = v[sel, y].astype(np.int64)
+        result = (v[sel, x] - vy_pre_op) & 0xff
+        v[sel, y] = result
+        v[sel, 0xf] = result > vy_pre_op
+        self.pc[sel] += 2
+
+    def vx_and_vy_store_in_vx(self, sel, op):
+        v = self.registers
+        x = op >> 8 & 0xf
+        v[sel, x] = v[sel, op >> 4 & 0xf] & v[sel, x]
+        self.pc[sel] += 2
+
+    def vx_or_vy_store_in_vx(self, sel, op):
+        v = self.registers
+        x = op >> 8 & 0xf
+        v[sel, x] = v[sel, op >> 4 & 0xf] | v[sel, x]
+        self.pc[sel] += 2
+
+    def vx_xor_vy_store_in_vx(self, sel, op):
+        v = self.registers
+        x = op >> 8 & 0xf
+        v[sel, x] = v[sel, op >> 4 & 0xf] ^ v[sel, x]
+        self.pc[sel] += 2
+
+    def shift_vy_right_store_in_vx(self, sel, op):
+        v = self.registers
+        vy_value = v[sel, op >> 4 & 0xf]
+        v[sel, 0xf] = vy_value & 1
+        v[sel, op >> 8 & 0xf] = vy_value >> 1
+        self.pc[sel] += 2
+
+    def shift_vy_left_store_in_vx(self, sel, op):
+        # VY is read again after VF is written, as in the CPU
+        v = self.registers
+        y = op >> 4 & 0xf
+        v[sel, 0xf] = v[sel, y] >> 7
+        v[sel, op >> 8 & 0xf] = (v[sel, y].astype(np.int64) << 1) & 0xff
+        self.pc[sel] += 2
+
+    def set_vx_random_masked(self, sel, op):
+        v = self.registers
+        randoms = self.randoms
+        for k, data in zip(sel.tolist(), op.tolist()):
+            v[k, data >> 8 & 0xf] = randoms[k].randint(0, 255) & data & 0xff
+        self.pc[sel] += 2
+
+    def jump_to_nnn(self, sel, op):
+        self.pc[sel] = op & 0xfff
+
+    def jump_to_nnn_plus_v0(self, sel, op):
+        self.pc[sel] = (op & 0xfff) + self.registers[sel, 0]
+
+    def exec_subroutine(self, sel, op):
+        full = self.sp[sel] == self.stack_size
+        if full.any():
+            self._fault(sel[full], 'OverflowError: Stack overflow')
+            sel, op = sel[~full], op[~full]
+        self.call_stack[sel, self.sp[sel]] = self.pc[sel]
+        self.sp[sel] += 1
+        self.pc[sel] = op & 0xfff
+
+    def return_from_subroutine(self, sel, op):
+        empty = self.sp[sel] == 0
+        if empty.any():
+            self._fault(sel[empty], 'IndexError: Stack underflow')
+            sel = sel[~empty]
+        self.sp[sel] -= 1
+        self.pc[sel] = self.call_stack[sel, self.sp[sel]] + 2
+
+    def skip_vx_eq_nn(self, sel, op):
+        self._skip_when(sel, self.registers[sel, op >> 8 & 0xf] == (op & 0xff))
+
+    def skip_vx_eq_vy(self, sel, op):
+        v = self.registers
+        self._skip_when(sel, v[sel, op >> 8 & 0xf] == v[sel, op >> 4 & 0xf])
+
+    def skip_vx_neq_nn(self, sel, op):
+        self._skip_when(sel, self.registers[sel, op >> 8 & 0xf] != (op & 0xff))
+
+    def skip_vx_neq_vy(self, sel, op):
+        v = self.registers
+        self._skip_when(sel, v[sel, op >> 8 & 0xf] != v[sel, op >> 4 & 0xf])
+
+    def set_delay_timer(self, sel, op):
+        self.delay_target[sel] = self._ticks(sel) + self.registers[sel, op >> 8 & 0xf]
+        self.pc[sel] += 2
+
+    def set_sound_timer(self, sel, op):
+        self.sound_target[sel] = self._ticks(sel) + self.registers[sel, op >> 8 & 0xf]
+        self.pc[sel] += 2
+
+    def delay_timer_to_vx(self, sel, op):
+        remaining = self.delay_target[sel] - self._ticks(sel)
+        self.registers[sel, op >> 8 & 0xf] = np.maximum(remaining, 0) & 0xff
+        self.pc[sel] += 2
+
+    def store_nnn_in_i(self, sel, op):
+        self.index_register[sel] = op & 0xfff
+        self.pc[sel] += 2
+
+    def add_vx_to_i(self, sel, op):
+        self.index_register[sel] = (self.registers[sel, op >> 8 & 0xf] + self.index_register[sel]) & 0xfff
+        self.pc[sel] += 2
+
+    def convert_vx_to_bcd(self, sel, op):
+        i = self.index_register[sel]
+        fits = i + 2 < self.memory.shape[1]
+        writing, i = sel[fits], i[fits]
+        vx = self.registers[writing, op[fits] >> 8 & 0xf]
+        self.memory[writing, i] = vx // 100
+        self.memory[writing, i + 1] = vx // 10 % 10
+        self.memory[writing, i + 2] = vx % 10
+        self.pc[sel] += 2
+
+    def v0_to_vx_to_memory(self, sel, op):
+        x = op >> 8 & 0xf
+        i = self.index_register[sel]
+        out_of_bounds = i + x + 1 > self.memory.shape[1]
+        if out_of_bounds.any():
+            self._fault(sel[out_of_bounds], 'IndexError: Write out of bounds')
+            sel, x, i = sel[~out_of_bounds], x[~out_of_bounds], i[~out_of_bounds]
+        for k in range(16):
+            m = x >= k
+            if not m.any():
+                break
+            self.memory[sel[m], i[m] + k] = self.registers[sel[m], k]
+        self.pc[sel] += 2
+
+    def memory_to_v0_to_vx(self, sel, op):
+        x = op >> 8 & 0xf
+        i = self.index_register[sel]
+        out_of_bounds = i + x + 1 > self.memory.shape[1]
+        if out_of_bounds.any():
+            self._fault(sel[out_of_bounds], 'IndexError: Read out of bounds')
+            sel, x, i = sel[~out_of_bounds], x[~out_of_bounds], i[~out_of_bounds]
+        for k in range(16):
+            m = x >= k
+            if not m.any():
+                break
+            self.registers[sel[m], k] = self.memory[sel[m], i[m] + k]
+        self.pc[sel] += 2
+
+    def draw_sprite(self, sel, op):
+        v = self.registers
+        xs = (v[sel, op >> 8 & 0xf] % SCREEN_WIDTH).astype(np.uint64)
+        ys = v[sel, op >> 4 & 0xf].astype(np.int64) % SCREEN_HEIGHT
+        i = self.index_register[sel]
+        heights = np.minimum(op & 0xf, self.memory.shape[1] - i)
+        collision = np.zeros(len(sel), dtype=bool)
+        for r in range(int(heights.max(initial=0))):
+            drawing = heights > r
+            y = ys + r
+            if self.wrap:
+                y %= SCREEN_HEIGHT
+            else:
+                drawing &= y < SCREEN_HEIGHT
+            if not drawing.any():
+                continue
+            k, x, y = sel[drawing], xs[drawing], y[drawing]
+            top = self.memory[k, i[drawing] + r].astype(np.uint64) << _SHIFT_TO_TOP
+            mask = top >> x
+            if self.wrap:
+                # Bits pushed off the right edge come back on the left
+                mask |= np.where(x > 0, top << ((np.uint64(SCREEN_WIDTH) - x) & np.uint64(SCREEN_WIDTH - 1)),
+                                 np.uint64(0))
+            rows = self.rows[k, y]
+            collision[drawing] |= (rows & mask) != 0
+            self.rows[k, y] = rows ^ mask
+        v[sel, 0xf] = collision
+        self.pc[sel] += 2
+
+    def clear_screen(self, sel, op):
+        self.rows[sel] = 0
+        self.pc[sel] += 2
+
+    def set_i_to_font_for_vx(self, sel, op):
+        self.index_register[sel] = (Memory.sprite_for_int(self.registers[sel, op >> 8 & 0xf].astype(np.int64))
+                                    & 0xfff)
+        self.pc[sel] += 2
+
+    def wait_for_keypad_store_in_vx(self, sel, op):
+        held = self.held[sel]
+        pressed = held != 0
+        sel, op = sel[pressed], op[pressed]
+        self.registers[sel, op >> 8 & 0xf] = _LOWEST_KEY[held[pressed] & 0xffff]
+        self.pc[sel] += 2
+
+    def _is_pressed(self, sel, op):
+        vx = self.registers[sel, op >> 8 & 0xf].astype(np.int64)
+        return (vx < 16) & ((self.held[sel] >> (vx & 0xf) & 1) != 0)
+
+    def skip_if_vx_eq_key_pressed(self, sel, op):
+        self._skip_when(sel, self._is_pressed(sel, op))
+
+    def skip_if_vx_neq_key_pressed(self, sel, op):
+        self._skip_when(sel, ~self._is_pressed(sel, op))